@@ -1,5 +1,4 @@
 import random
-import copy
 from parser import Token, TokenType
 from mutator.AddCast            import AddCast
 from mutator.AddKeyword         import AddKeyword
@@ -12,6 +11,9 @@ from mutator.ChangeWhitespace   import ChangeWhitespace
 from mutator.DeleteToken        import DeleteToken
 from mutator.SwapLines          import SwapLines
 from mutator.SwapTokens         import SwapTokens
+from mutator.FailureMemory      import FailureMemory
+from mutator.MutatorScheduler   import MutatorScheduler
+from mutator.TokenIndex         import TokenIndex
 
 # what others should we have?
 # - remove cast
@@ -73,6 +75,28 @@ class MutatorCollection:
     _identifiers: list[str] = None
     """The identifiers present in the code being mutated."""
 
+    index: TokenIndex = None
+    """The code being mutated. Mutators change it through this."""
+
+    _base: TokenIndex = None
+    """Index of the code last passed to mutate(), which is usually
+    passed again (when mutating the original code)."""
+
+    failures: FailureMemory = None
+    """Edits known to make the code fail to compile, or None to
+    not avoid any."""
+
+    edits: list[int] = None
+    """The FailureMemory keys of the edits made by the last call
+    to mutate()."""
+
+    scheduler: MutatorScheduler = None
+    """Decides which mutators to use, or None to pick them
+    uniformly."""
+
+    used: list[int] = None
+    """Indices of the mutators used by the last call to mutate()."""
+
     def __init__(self):
         self._mutators = tuple(map(lambda c: c(self), (
             AddCast,
@@ -88,10 +112,27 @@ class MutatorCollection:
             SwapTokens,
         )))
         self._identifiers = []
+        self.edits = []
+        self.used  = []
+
+    def mutatorNames(self) -> list[str]:
+        """Return the names of the mutators, in index order."""
+        return [type(m).__name__ for m in self._mutators]
 
     def mutate(self, code:list[Token], count:int=1) -> list[Token]:
-        """Applies specified number of random mutations."""
-        self._findIdentifiers(code) # do this once at start
+        """Applies specified number of random mutations.
+
+        :param code: The code to mutate. Not changed, and must not
+            be changed later, since its index is kept.
+        :returns: The mutated copy.
+        """
+        if self._base is None or self._base.code is not code:
+            self._base = TokenIndex(code) # never changed, only copied
+        self.index = self._base.copy()
+        self._identifiers = self._base.identifiers()
+        code = self.index.code
+        self.edits = []
+        self.used  = []
         for _ in range(count):
             code = self._mutateOnce(code)
         return code
@@ -101,24 +142,34 @@ class MutatorCollection:
         limit = 100
         while limit > 0:
             limit -= 1
-            oldCode = copy.copy(code)
-            mutator = random.choice(self._mutators)
+            saved = self.index.copy() # to undo the change
+            oldCode = saved.code
+            if self.scheduler is None:
+                iMutator = random.randrange(len(self._mutators))
+            else: iMutator = self.scheduler.pick()
+            mutator = self._mutators[iMutator]
             code = mutator.mutate(code)
+            if code is not self.index.code: # replaced, not changed
+                self.index = TokenIndex(code)
             # do not delete everything. leave at least
             # 2 tokens so that randint(0, len(code)-1)
             # is not an empty range.
-            if len(code) < 2: code = oldCode
-            if code != oldCode: break
+            if len(code) < 2: self.index, code = saved, oldCode
+            if code == oldCode: continue
+            if self.failures is None:
+                self.used.append(iMutator)
+                break
+            key = self.failures.editKey(type(mutator).__name__,
+                oldCode, code)
+            # the more often it failed, the less likely we keep it
+            if random.random() < self.failures.failRate(key):
+                self.index, code = saved, oldCode
+                continue
+            self.edits.append(key)
+            self.used.append(iMutator)
+            break
         return code
 
-    def _findIdentifiers(self, code:list[Token]) -> None:
-        """Populate self._identifiers."""
-        # convert to set and back to list to remove duplicates
-        self._identifiers = list(
-            set(map(lambda t: t.value,
-                filter(lambda t: t.type == TokenType.IDENTIFIER,
-                code))))
-
     def getIdentifers(self) -> list[str]:
         """Get the identifiers found in the current code."""
         return self._identifiers
@@ -133,48 +184,31 @@ class MutatorCollection:
             if val != exclude: return val
         raise RuntimeError("No identifiers found")
 
-    def randomToken(self, tokens:list[Token], filt:callable) -> Token:
-        """Return one random token from the given list.
+    def randomToken(self, tokenType:TokenType) -> int | None:
+        """Return the position of one random token of the given
+        type in the code being mutated, or None if there are none."""
+        return self.index.randomPosition(tokenType)
 
-        :param tokens: The token list to choose from.
-        :param filt: Function to select eligible tokens.
-        """
-        tokens = list(filter(filt, tokens))
-        if len(tokens) == 0: return None
-        return random.choice(tokens)
-
-    def cloneToken(self, code:list[Token], token:Token) -> Token:
-        """Create a duplicate of the given token.
-
-        :param code: The list of tokens being processed.
-        :param token: The token to clone.
-        :returns: A clone of the token.
+    def cloneToken(self, pos:int) -> Token:
+        """Replace the token at the given position with a
+        duplicate, and return the duplicate.
 
         This is used when we want to change the properties of
         a token, because tokens are immutable.
         """
-        idx = code.index(token)
-        token = token.clone()
-        code[idx] = token # replace with the clone
+        token = self.index.code[pos].clone()
+        self.index.replace(pos, token)
         return token
 
-    def getTokensForLineRange(self, code:list[Token],
+    def getTokensForLineRange(self,
     lines:tuple[int]) -> (list[Token], int, int):
-        """Get the tokens that occupy the given line range.
+        """Get the tokens of the code being mutated that occupy
+        the given line range.
 
-        :param code: Token list to read.
         :param lines: First and last line number.
         :returns: The tokens, and the indices of the first
             and last token in the code.
         """
-        iFirst, iLast = 0, 0
-        lStart, lEnd = lines
-        for i, token in enumerate(code):
-            if token.line < lStart:
-                iFirst = i
-            elif token.line <= lEnd:
-                iLast = i + 1  # range is exclusive
-            else:
-                break
+        iFirst, iLast = self.index.lineRange(*lines)
         if iLast <= iFirst: return [], 0, 0
-        return code[iFirst:iLast], iFirst, iLast
+        return self.index.code[iFirst:iLast], iFirst, iLast
@@ -1,11 +1,10 @@
 #!/usr/bin/env python
 # eg: ./__main__.py --dir=../sfadebug/ --lines=1,4 src/main/objects.c build/GSAP01-DEBUG/src/main/objects.o
 
-# BUG: extra spaces are being added to string constants
-# (maybe only when they start with spaces?)
 import os
 import argparse
 from app import App
+from evaluator.DiffScorer import DiffScorer
 
 argParser = argparse.ArgumentParser()
 argParser.add_argument("srcPath")
@@ -15,6 +14,90 @@ argParser.add_argument(
     "--lines", help="Range of lines to mutate "
     "(separated by comma eg: 1,4)"
 )
+argParser.add_argument(
+    "--workers", type=int, help="Number of candidates to "
+    "compile at once (default: number of CPUs)"
+)
+argParser.add_argument(
+    "--score-workers", type=int, help="Number of candidates to "
+    "score at once (default: same as --workers)"
+)
+argParser.add_argument(
+    "--batch", type=int, help="Number of candidates to compile "
+    "with one compiler process (default: 1)"
+)
+argParser.add_argument(
+    "--preprocess", action="store_true", help="Preprocess the source "
+    "once and compile the preprocessed code for each candidate"
+)
+argParser.add_argument(
+    "--function", action="store_true", help="Only compile and score "
+    "the function containing the line range"
+)
+argParser.add_argument(
+    "--whole-object", action="store_true", help="Score the whole "
+    "object instead of only the functions in the line range"
+)
+argParser.add_argument(
+    "--metric", choices=DiffScorer.metrics, help="How to score "
+    "the diff: length of the output, or mismatched instructions "
+    "in objdiff's JSON output (default: length)"
+)
+argParser.add_argument(
+    "--no-syntax-check", action="store_true", help="Compile every "
+    "candidate, even ones that clearly can't compile"
+)
+argParser.add_argument(
+    "--no-fingerprints", action="store_true", help="Don't reuse the "
+    "score of code that only differs in whitespace and comments; use "
+    "this if line numbers affect the output (eg __LINE__ in asserts)"
+)
+argParser.add_argument(
+    "--no-failure-memory", action="store_true", help="Don't avoid "
+    "mutations that keep making candidates fail to compile"
+)
+argParser.add_argument(
+    "--no-adaptive-mutators", action="store_true", help="Use every "
+    "mutator equally often, instead of favouring the ones that work"
+)
+argParser.add_argument(
+    "--prescore", action="store_true", help="Compare the compiled "
+    "code in-process first, and only run the score command for "
+    "candidates that are close enough"
+)
+argParser.add_argument(
+    "--tmpdir", help="Directory for the files compiled for each "
+    "candidate; use a tmpfs such as /dev/shm to avoid writing them "
+    "to disk"
+)
+argParser.add_argument(
+    "--target", type=int, help="Stop once a candidate scores this "
+    "or lower (default: 0, a match)"
+)
+argParser.add_argument(
+    "--max-time", type=float, help="Stop after this many seconds"
+)
+argParser.add_argument(
+    "--max-generations", type=int, help="Stop after this many "
+    "generations"
+)
+argParser.add_argument(
+    "--max-stale", type=int, help="Stop after this many generations "
+    "in a row without a better score"
+)
+argParser.add_argument(
+    "--checkpoint", help="File to save progress to, so the run can "
+    "be resumed (default with --resume: gendec-checkpoint.bin in the "
+    "working directory)"
+)
+argParser.add_argument(
+    "--resume", action="store_true", help="Continue from the "
+    "checkpoint instead of starting over"
+)
+argParser.add_argument(
+    "--db", help="File to keep scores in, to reuse them in later "
+    "runs, eg gendec-scores.db"
+)
 
 
 def main():
@@ -33,6 +116,58 @@ def main():
             print("Invalid line numbers")
             return
 
+    if "workers" in args and args.workers is not None:
+        try:
+            app.setNumWorkers(args.workers)
+        except ValueError:
+            print("Invalid worker count")
+            return
+
+    if args.score_workers is not None:
+        try:
+            app.setNumScoreWorkers(args.score_workers)
+        except ValueError:
+            print("Invalid worker count")
+            return
+
+    if args.batch is not None:
+        try:
+            app.setBatchSize(args.batch)
+        except ValueError:
+            print("Invalid batch size")
+            return
+
+    if "db" in args and args.db is not None:
+        app.setScoreDatabase(args.db)
+
+    if args.preprocess: app.usePreprocessed = True
+    if args.function: app.useFunctionScope = True
+    if args.whole_object: app.scoreWholeObject = True
+    if args.prescore: app.usePreScorer = True
+    if args.no_syntax_check: app.useSyntaxCheck = False
+    if args.no_fingerprints: app.useFingerprints = False
+    if args.no_failure_memory: app.useFailureMemory = False
+    if args.no_adaptive_mutators: app.useScheduler = False
+    if args.metric is not None: app.scoreMetric = args.metric
+
+    if "tmpdir" in args and args.tmpdir is not None:
+        try:
+            app.setTempDir(args.tmpdir)
+        except ValueError:
+            print("Invalid temporary directory")
+            return
+
+    if args.target is not None: app.targetScore = args.target
+    if args.max_time is not None: app.timeBudget = args.max_time
+    if args.max_generations is not None:
+        app.maxGenerations = args.max_generations
+    if args.max_stale is not None:
+        app.maxStaleGenerations = args.max_stale
+
+    if args.checkpoint is not None or args.resume:
+        app.setCheckpoint(args.checkpoint or "gendec-checkpoint.bin",
+            args.resume)
+
     app.run(args.srcPath, args.tgtPath)
 
 
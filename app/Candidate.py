@@ -0,0 +1,56 @@
+from __future__ import annotations
+from parser import Token
+
+class Candidate:
+    """One member of the population.
+
+    Only the tokens in the permute line range ever change, so a
+    candidate only stores those (the window). The tokens before
+    and after it are shared with every other candidate.
+    """
+    __slots__ = ('before', 'window', 'after', 'edits', 'mutators',
+        'parentScore')
+
+    def __init__(self, before:list[Token], window:list[Token],
+    after:list[Token], edits:tuple[int]=(), mutators:tuple[int]=(),
+    parentScore:float=None):
+        """Instantiate Candidate.
+
+        :param before: The tokens before the window. Not copied.
+        :param window: The tokens that can be changed.
+        :param after: The tokens after the window. Not copied.
+        :param edits: The FailureMemory keys of the mutations
+            that made this candidate from its parent.
+        :param mutators: The indices of the mutators that made
+            this candidate from its parent.
+        :param parentScore: The score this candidate must beat
+            to be an improvement, if known.
+        """
+        self.before      = before
+        self.window      = window
+        self.after       = after
+        self.edits       = edits
+        self.mutators    = mutators
+        self.parentScore = parentScore
+
+    @classmethod
+    def fromTokens(cls, tokens:list[Token], iFirst:int,
+    iLast:int) -> Candidate:
+        """Split a token list into a candidate.
+
+        :param tokens: The whole code.
+        :param iFirst: Index of the first token in the window.
+        :param iLast: Index after the last token in the window.
+        """
+        return cls(tokens[:iFirst], tokens[iFirst:iLast], tokens[iLast:])
+
+    def withWindow(self, window:list[Token], edits:tuple[int]=(),
+    mutators:tuple[int]=(), parentScore:float=None) -> Candidate:
+        """Return a candidate with the same surrounding code
+        and a different window."""
+        return Candidate(self.before, window, self.after, edits,
+            mutators, parentScore)
+
+    def tokens(self) -> list[Token]:
+        """Return the whole code as one token list."""
+        return self.before + self.window + self.after
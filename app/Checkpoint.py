@@ -0,0 +1,91 @@
+from os import PathLike
+from pathlib import Path
+import os
+import pickle
+import tempfile
+import zlib
+from app.Candidate import Candidate
+
+class Checkpoint:
+    """The state of the genetic algorithm between generations,
+    so that a run can be resumed later.
+
+    This is stored as a zlib-compressed pickle. Members of the
+    population share most of their tokens, and pickle only writes
+    each shared token once, so this stays fairly small.
+    """
+
+    magic: bytes = b"GENDECK2"
+    """Identifies checkpoint files and their format version."""
+
+    sourceKey: bytes = None
+    """Digest of the original source, to make sure the checkpoint
+    belongs to the file being resumed."""
+
+    generationNum: int = 0
+    """The number of the last generation that finished."""
+
+    population: list[Candidate] = None
+    """The members of the next generation to evaluate."""
+
+    originalSource: Candidate = None
+    """The original code, as a member."""
+
+    bestSource: Candidate = None
+    """The best-scoring member found so far."""
+
+    bestScore: float = None
+    """The score of bestSource."""
+
+    initialScore: float = None
+    """The score of the original code."""
+
+    scoreSymbols: list[str] = None
+    """The symbols being scored, if not the whole object."""
+
+    fullSource: Candidate = None
+    """The original code with the whole file around the window,
+    if only part of the file is compiled."""
+
+    context: bytes = None
+    """Digest of the settings the scores depend on (see
+    App.buildContext())."""
+
+    scores: dict = None
+    """Known scores, by cache name, as lists of `(key, score)`."""
+
+    randomState: tuple = None
+    """The state of the `random` module."""
+
+    def save(self, path:PathLike) -> None:
+        """Write the checkpoint to the given file.
+
+        The file is replaced atomically, so a crash while saving
+        leaves the previous checkpoint intact.
+        """
+        path = Path(path)
+        data = self.magic + zlib.compress(pickle.dumps(self.__dict__,
+            protocol=pickle.HIGHEST_PROTOCOL), 6)
+        fd, tmpPath = tempfile.mkstemp(dir=path.parent,
+            prefix=path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmpPath, path)
+        except BaseException:
+            os.unlink(tmpPath)
+            raise
+
+    @classmethod
+    def load(cls, path:PathLike) -> "Checkpoint":
+        """Read a checkpoint from the given file."""
+        with open(path, "rb") as file:
+            data = file.read()
+        if not data.startswith(cls.magic):
+            raise ValueError(f"{path} is not a checkpoint file")
+        result = cls()
+        result.__dict__.update(pickle.loads(
+            zlib.decompress(data[len(cls.magic):])))
+        return result
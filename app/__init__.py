@@ -1,17 +1,67 @@
 from os import PathLike
 from pathlib import Path
+import hashlib
 import math
+import os
+import re
 import random
 import shutil
 import tempfile
+import time
 import subprocess
 from parser import Parser, Token, TokenType
+from parser.Canonicalizer import Canonicalizer
+from parser.SyntaxChecker import SyntaxChecker
 from MutatorCollection import MutatorCollection
+from mutator.FailureMemory import FailureMemory
+from mutator.MutatorScheduler import MutatorScheduler
+from app.Candidate import Candidate
+from app.Checkpoint import Checkpoint
+from evaluator import Evaluator
+from evaluator.Stage import ProcessTimeout
+from evaluator.ScoreCache import ScoreCache
+from evaluator.ScoreDatabase import ScoreDatabase
+from evaluator.Elf import ElfFile, Symbol
+from evaluator.PreScorer import PreScorer
+from evaluator.DiffScorer import DiffScorer
+from evaluator.BatchCompiler import BatchCompiler
 from config import cflags, buildPreprocessCommand, \
     buildCompileCommand, buildScoreCommand
 
 Infinity = float("inf")
 
+TriagePenalty = 1000000000
+"""Added to the scores of candidates that are only estimated,
+because the pre-scorer rejected them or their score command was
+stopped early, so that they sort after every real score."""
+
+def isEstimate(score:float) -> bool:
+    """Check whether a score is only the pre-scorer's estimate."""
+    return TriagePenalty <= score < Infinity
+
+# names given to compiler inputs by tempfile.NamedTemporaryFile
+re_tempSourceName = re.compile(rb'tmp[a-z0-9_]{8}\.c')
+
+# line markers left in preprocessed code, eg `#line 12 "foo.c"`
+re_lineMarker = re.compile(r'^\s*#\s*(?:line\s+)?(\d+)\s+"([^"]*)"')
+
+def isRamBacked(path:PathLike) -> bool:
+    """Check whether the given directory is on a RAM-backed
+    filesystem such as tmpfs (only detected on Linux)."""
+    path = os.path.realpath(path)
+    fsType, mountLen = None, -1
+    try:
+        with open("/proc/mounts", "r") as file:
+            for line in file:
+                _, mount, typ = line.split()[:3]
+                mount = mount.replace('\\040', ' ')
+                if (len(mount) > mountLen and (path == mount
+                or path.startswith(mount.rstrip('/') + '/'))):
+                    fsType, mountLen = typ, len(mount)
+    except OSError:
+        return False
+    return fsType in ('tmpfs', 'ramfs')
+
 class App:
     """The application as a whole."""
 
@@ -33,6 +83,168 @@ class App:
     mutator: MutatorCollection = None
     """The mutator."""
 
+    evaluator: Evaluator = None
+    """Runs the compile and score commands in parallel."""
+
+    batchSize: int = 1
+    """How many candidates to compile with one compiler process."""
+
+    batchCompiler: BatchCompiler = None
+    """Compiles candidates in batches, if batchSize > 1."""
+
+    scoreCache: ScoreCache = None
+    """Scores of code that was already evaluated."""
+
+    fingerprintCache: ScoreCache = None
+    """Scores of code that was already evaluated, ignoring
+    whitespace and comments."""
+
+    objectCache: ScoreCache = None
+    """Scores of object files that were already evaluated."""
+
+    scoreDbPath: Path = None
+    """Path of the on-disk score database, or None to not use one."""
+
+    scoreDb: ScoreDatabase = None
+    """Scores from this and previous runs."""
+
+    tempDir: Path = None
+    """Directory for the files compiled for each candidate, or
+    None to use the system's temporary directory. If this is set
+    to a tmpfs (eg /dev/shm), best.c is only written along with
+    checkpoints and at exit, so nothing else touches the disk."""
+
+    bytesWritten: int = 0
+    """Number of bytes written to disk (not counting RAM-backed
+    temporary directories)."""
+
+    _tempOnDisk: bool = True
+    """Whether tempDir is on a real disk."""
+
+    _deferBest: bool = False
+    """Whether to write best.c only along with checkpoints and at
+    exit, instead of on each improvement."""
+
+    usePreprocessed: bool = False
+    """Whether to preprocess the source once at startup and mutate
+    and compile the preprocessed code, so that each compile skips
+    the preprocessor and header lookup. best.c is then also
+    preprocessed code."""
+
+    useFunctionScope: bool = False
+    """Whether to compile only the function containing the
+    permute line range (plus the declarations it needs) instead
+    of the whole file, and only score that function."""
+
+    fullSource: Candidate = None
+    """The original code with the whole file around the window,
+    if only part of the file is compiled, so that best.c can be
+    used in place of the original file."""
+
+    scoreWholeObject: bool = False
+    """Whether to score the whole object instead of only the
+    functions in the permute line range."""
+
+    scoreSymbols: list[str] = None
+    """The symbols to score, or None to score the whole object."""
+
+    targetSymbols: dict[str, Symbol] = None
+    """The functions in the target object, by name."""
+
+    scoreMetric: str = 'length'
+    """How to turn the score command's output into a score;
+    one of DiffScorer.metrics."""
+
+    diffScorer: DiffScorer = None
+    """Runs the score command."""
+
+    selectionCutoff: float = Infinity
+    """The score of the worst member selected in the last
+    generation. Scoring stops early above this, since such
+    candidates can't be selected."""
+
+    usePreScorer: bool = False
+    """Whether to compare the compiled code to the target in-process
+    first, and only run the score command for candidates that look
+    good enough."""
+
+    preScorer: PreScorer = None
+    """Estimates scores without the score command."""
+
+    triageThreshold: float = Infinity
+    """Candidates whose pre-scorer distance is above this don't get
+    a real score."""
+
+    triageMargin: float = 1.25
+    """How much worse than the distance of the worst selected
+    candidate can be and still get a real score."""
+
+    numTriaged: int = 0
+    """Number of candidates that didn't get a real score."""
+
+    checkpointPath: Path = None
+    """Path to save the GA state to, or None to not save it."""
+
+    checkpointInterval: int = 10
+    """How many generations to run between checkpoints."""
+
+    resume: bool = False
+    """Whether to continue from the checkpoint instead of
+    starting over."""
+
+    useFailureMemory: bool = True
+    """Whether to avoid mutations that keep making candidates
+    fail to compile."""
+
+    useScheduler: bool = True
+    """Whether to use the mutators that have worked best more
+    often."""
+
+    useSyntaxCheck: bool = True
+    """Whether to skip compiling candidates that clearly can't
+    compile."""
+
+    syntaxChecker: SyntaxChecker = None
+    """Finds candidates that can't compile."""
+
+    syntaxAuditInterval: int = 20
+    """Compile every this many rejected candidates anyway, to
+    measure how many of them could actually compile."""
+
+    numSyntaxChecked: int = 0
+    """Number of candidates checked by the syntax checker."""
+
+    numSyntaxRejected: int = 0
+    """Number of candidates rejected by the syntax checker."""
+
+    numSyntaxAudited: int = 0
+    """Number of rejected candidates that were compiled anyway."""
+
+    numFalseRejects: int = 0
+    """Number of rejected candidates that compiled."""
+
+    targetScore: float = 0
+    """Stop as soon as a candidate scores this or lower."""
+
+    timeBudget: float = None
+    """Stop after this many seconds, or None for no limit."""
+
+    maxGenerations: int = None
+    """Stop after this many generations (counting the ones before
+    resuming), or None for no limit."""
+
+    maxStaleGenerations: int = None
+    """Stop after this many generations in a row without a better
+    score, or None for no limit."""
+
+    stopReason: str = None
+    """Why the run stopped, or None while it's running."""
+
+    useFingerprints: bool = True
+    """Whether to reuse the score of code that only differs in
+    whitespace and comments. This should be disabled if the line
+    numbers affect the output (eg `__LINE__` in asserts)."""
+
     permuteLineRange: tuple[int,int] = (1, 1000000)
     """The first and last line to change."""
 
@@ -42,19 +254,47 @@ class App:
     mutationRate: int = 5
     """How much to change each member."""
 
-    originalSource: str = ""
+    originalSource: Candidate = None
     """The original source code."""
 
-    bestSource: str = ""
+    originalKey: bytes = None
+    """Digest of the original source file."""
+
+    _textBefore: bytes = None
+    """The code before the permute window, which is the same
+    for every member."""
+
+    _textAfter: bytes = None
+    """The code after the permute window."""
+
+    _keysBefore: tuple[bytes, bytes, tuple] = None
+    """Digest of the code before the window, digest of its
+    canonical form, and the Canonicalizer state after it."""
+
+    _keysAfter: tuple[bytes, dict[tuple, bytes]] = None
+    """Digest of the code after the window, and the digest of
+    its canonical form for each Canonicalizer state it can
+    follow."""
+
+    bestSource: Candidate = None
     """The best-scoring code found so far."""
 
     initialScore = Infinity
     """The score of the original code."""
 
+    _state: tuple[list, int, float] = None
+    """The population, generation number and best score after the
+    last finished generation, for saveCheckpoint()."""
+
     def __init__(self):
         self.cflags = cflags
         self.parser = Parser()
         self.mutator = MutatorCollection()
+        self.evaluator = Evaluator()
+        self.scoreCache = ScoreCache()
+        self.fingerprintCache = ScoreCache()
+        self.objectCache = ScoreCache()
+        self._triageSamples = [] # (distance, score) this generation
 
     def setPermuteLineRange(self, lFirst:int, lLast:int) -> None:
         """Set the line range to modify."""
@@ -62,6 +302,48 @@ class App:
             raise ValueError("Invalid line range")
         self.permuteLineRange = [lFirst, lLast]
 
+    def setNumWorkers(self, count:int) -> None:
+        """Set how many candidates to compile at once."""
+        if count < 1:
+            raise ValueError("Invalid worker count")
+        self.evaluator.numWorkers = count
+
+    def setNumScoreWorkers(self, count:int) -> None:
+        """Set how many candidates to score at once."""
+        if count < 1:
+            raise ValueError("Invalid worker count")
+        self.evaluator.numScoreWorkers = count
+
+    def setBatchSize(self, count:int) -> None:
+        """Set how many candidates to compile with one compiler
+        process."""
+        if count < 1:
+            raise ValueError("Invalid batch size")
+        self.batchSize = count
+
+    def setScoreDatabase(self, path:PathLike) -> None:
+        """Set the path of the database to keep scores in
+        between runs."""
+        self.scoreDbPath = Path(path)
+
+    def setTempDir(self, path:PathLike) -> None:
+        """Set the directory for the files compiled for each
+        candidate. Use a tmpfs to avoid writing them to disk."""
+        path = Path(path)
+        if not path.is_dir():
+            raise ValueError("Not a directory")
+        self.tempDir = path
+
+    def setCheckpoint(self, path:PathLike, resume:bool=False) -> None:
+        """Set the path to save the GA state to.
+
+        :param path: The checkpoint file.
+        :param resume: Whether to continue from the state saved
+            in this file.
+        """
+        self.checkpointPath = Path(path)
+        self.resume = resume
+
     def run(self, sourceFilePath:PathLike,
     targetObjPath:PathLike) -> None:
         """Run the app.
@@ -71,6 +353,10 @@ class App:
         """
         self.sourceFilePath = Path(sourceFilePath)
         self.targetObjPath = Path(targetObjPath)
+        self.stopReason = None
+        self._startTime = time.monotonic()
+        # before touching the source, so a bad target can't lose it
+        self.targetSymbols = ElfFile.load(self.targetObjPath).functions()
         try:
             self.begin()
             self._mainLoop()
@@ -79,17 +365,32 @@ class App:
 
     def _mainLoop(self):
         """Main genetic algorithm loop."""
-        self.bestSolution = None
-        self.bestSource = self.originalSource
-        population = self.generateInitialPopulation()
-        generationNum = 0
-        bestScore = Infinity
+        if self.resume:
+            population, generationNum, bestScore = \
+                self.loadCheckpoint()
+        else:
+            population = self.generateInitialPopulation()
+            self.bestSource = self.originalSource
+            generationNum = 0
+            bestScore = Infinity
+            if self.checkStop(self.initialScore):
+                print("Stopping:", self.stopReason)
+                return
 
+        numStale = 0 # generations without a better score
         while True:
             generationNum += 1
 
             # calculate fitness for each member
             print(f"Gen {generationNum:5d} ", end="")
+            written = self.bytesWritten
+            triaged = self.numTriaged
+            timeouts = self.evaluator.numTimeouts()
+            checked  = self.numSyntaxChecked
+            rejected = self.numSyntaxRejected
+            failures = self.mutator.failures
+            if failures is not None:
+                recorded, failed = failures.numRecorded, failures.numFailed
             selected, scores = self.select(population)
 
             # show the result
@@ -97,13 +398,33 @@ class App:
             if score < bestScore:
                 bestScore = score
                 self.bestSource = selected[0]
-                with open("best.c", "wt") as file:
-                    file.write(self.parser.toString(selected[0]))
+                if not self._deferBest: self.writeBest()
+                numStale = 0
+            else: numStale += 1
             print(
                 f"score {score:7d} ({score-self.initialScore:5d}) "
                 f"best {bestScore:7d} "
-                f"({bestScore-self.initialScore:5d})"
+                f"({bestScore-self.initialScore:5d}) "
+                f"hit {self.scoreCache.hitRate():4.0%} "
+                f"fp {self.fingerprintCache.hitRate():4.0%} "
+                f"obj {self.objectCache.hitRate():4.0%}"
+                + (f" db {self.scoreDb.hitRate():4.0%}"
+                    if self.scoreDb is not None else "")
+                + f" disk {(self.bytesWritten-written)/1024:6.0f}K"
+                + (f" tri {self.numTriaged-triaged:3d}"
+                    if self.preScorer is not None else "")
+                + (f" timeout {self.evaluator.numTimeouts()-timeouts}"
+                    if self.evaluator.numTimeouts() > timeouts else "")
+                + (f" syn {self.syntaxRejectRate(checked, rejected):4.0%}"
+                    f" fr {self.numFalseRejects}/{self.numSyntaxAudited}"
+                    if self.syntaxChecker is not None else "")
+                + (f" valid {failures.validRate(recorded, failed):4.0%}"
+                    if failures is not None else "")
             )
+            scheduler = self.mutator.scheduler
+            if scheduler is not None:
+                scheduler.update()
+                print("    mutators:", scheduler.summary())
 
             # create next generation by combining best performers
             population = []
@@ -118,8 +439,9 @@ class App:
                 population.append(parent1)
                 population.append(parent2)
                 child = self.crossover(parent1, parent2)
-                if len(child) > 1:
-                    child = self.mutate(child)
+                if len(child.window) > 1:
+                    child = self.mutate(child, min(scores[id(parent1)],
+                        scores[id(parent2)]))
                     if child:
                         population.append(child)
                         i += 2
@@ -127,127 +449,716 @@ class App:
 
             # add additional new members
             while len(population) < self.populationSize:
-                child = self.mutate(self.originalSource)
+                child = self.mutate(self.originalSource,
+                    self.initialScore)
                 if child: population.append(child)
 
+            self._state = (population, generationNum, bestScore)
+            if generationNum % self.checkpointInterval == 0:
+                self.saveCheckpoint()
+            # only once the next generation is made, so that the
+            # state saved at exit matches bestSource.
+            if self.checkStop(score, generationNum, numStale):
+                print("Stopping:", self.stopReason)
+                break
+
+    def checkStop(self, score:float=Infinity, generationNum:int=0,
+    numStale:int=0) -> bool:
+        """Check whether the run should stop, and if so, set
+        stopReason.
+
+        :param score: The best score so far.
+        :param generationNum: The number of finished generations.
+        :param numStale: How many generations in a row had no
+            better score.
+        :returns: Whether to stop.
+        """
+        if self.stopReason is not None: return True
+        if score <= self.targetScore:
+            self.stopReason = ("found a match" if score == 0
+                else f"reached score {score}")
+        elif (self.timeBudget is not None
+        and time.monotonic() - self._startTime >= self.timeBudget):
+            self.stopReason = "out of time"
+        elif (self.maxGenerations is not None
+        and generationNum >= self.maxGenerations):
+            self.stopReason = f"ran {generationNum} generations"
+        elif (self.maxStaleGenerations is not None
+        and numStale >= self.maxStaleGenerations):
+            self.stopReason = f"no improvement in {numStale} generations"
+        return self.stopReason is not None
+
     def begin(self) -> None:
         """Prepare source files."""
         # move the original file to a safe backup.
-        self.origSourcePath = Path(str(self.sourceFilePath) + ".gendec-orig.c")
-        shutil.move(self.sourceFilePath, self.origSourcePath)
+        backupPath = Path(str(self.sourceFilePath) + ".gendec-orig.c")
+        shutil.move(self.sourceFilePath, backupPath)
+        self.origSourcePath = backupPath
+        self._tempOnDisk = not isRamBacked(
+            self.tempDir or tempfile.gettempdir())
+        # only when asked for; the system's temporary directory
+        # being a tmpfs isn't a reason to risk losing best.c
+        self._deferBest = self.tempDir is not None and not self._tempOnDisk
+        if self.useFailureMemory:
+            self.mutator.failures = FailureMemory()
+        if self.useScheduler:
+            self.mutator.scheduler = MutatorScheduler(
+                self.mutator.mutatorNames())
+        if self.batchSize > 1:
+            self.batchCompiler = BatchCompiler(self.evaluator,
+                lambda inPaths, outDir: buildCompileCommand(self.cflags,
+                    inPaths, outDir),
+                self.batchSize, self.tempDir)
 
     def finish(self) -> None:
         """Restore source files to original state."""
-        try:
-            #os.unlink(sourceFilePath)
-            # debug
-            shutil.move(self.sourceFilePath, "last.c")
-        except FileNotFoundError:
-            pass
-        shutil.move(self.origSourcePath, self.sourceFilePath)
-
-    # not used...
+        # if begin() failed before the backup, the source is
+        # still where it was.
+        if self.origSourcePath is not None:
+            try:
+                #os.unlink(sourceFilePath)
+                # debug
+                shutil.move(self.sourceFilePath, "last.c")
+            except FileNotFoundError:
+                pass
+            shutil.move(self.origSourcePath, self.sourceFilePath)
+            self.origSourcePath = None
+        self.evaluator.stop()
+        if self.scoreDb is not None:
+            self.scoreDb.close()
+            self.scoreDb = None
+        # keep the last finished generation if we were interrupted
+        self.saveCheckpoint()
+        if self._deferBest: self.writeBest()
+
+    def writeBest(self) -> None:
+        """Write the best-scoring code found so far to best.c."""
+        if self.bestSource is None: return
+        source = self.bestSource
+        if self.fullSource is not None:
+            source = self.fullSource.withWindow(source.window)
+        data = self.parser.toString(source.tokens())
+        with open("best.c", "wt") as file:
+            file.write(data)
+        self.countDiskWrite(len(data))
+
+    def countDiskWrite(self, size:int) -> None:
+        """Add to the number of bytes written to disk."""
+        self.bytesWritten += size
+
+    def saveCheckpoint(self) -> None:
+        """Save the state of the last finished generation."""
+        if self.checkpointPath is None or self._state is None:
+            return
+        population, generationNum, bestScore = self._state
+        ckpt = Checkpoint()
+        ckpt.sourceKey      = self.originalKey
+        ckpt.generationNum  = generationNum
+        ckpt.population     = population
+        ckpt.originalSource = self.originalSource
+        ckpt.bestSource     = self.bestSource
+        ckpt.bestScore      = bestScore
+        ckpt.initialScore   = self.initialScore
+        ckpt.scoreSymbols   = self.scoreSymbols
+        ckpt.fullSource     = self.fullSource
+        ckpt.context        = self.buildContext()
+        ckpt.randomState    = random.getstate()
+        ckpt.scores = {
+            "source":      self.scoreCache.items(),
+            "fingerprint": self.fingerprintCache.items(),
+            "object":      self.objectCache.items(),
+        }
+        ckpt.save(self.checkpointPath)
+        self.countDiskWrite(os.path.getsize(self.checkpointPath))
+        if self._deferBest: self.writeBest()
+
+    def loadCheckpoint(self) -> tuple[list, int, float]:
+        """Restore the state saved by saveCheckpoint().
+
+        :returns: The population, the generation number and the
+            best score.
+        """
+        ckpt = Checkpoint.load(self.checkpointPath)
+        with open(self.origSourcePath, "r") as file:
+            self.originalKey = self.sourceKey(file.read())
+            if self.originalKey != ckpt.sourceKey:
+                raise RuntimeError("The source file has changed "
+                    "since the checkpoint was saved")
+        self.setOriginal(ckpt.originalSource)
+        self.bestSource     = ckpt.bestSource
+        self.initialScore   = ckpt.initialScore
+        self.scoreSymbols   = ckpt.scoreSymbols
+        self.fullSource     = ckpt.fullSource
+        # the scores mean nothing with other flags, commands,
+        # metric or target.
+        if ckpt.context != self.buildContext():
+            raise RuntimeError("The compile or score settings or the "
+                "target have changed since the checkpoint was saved")
+        self.prepareScoring()
+        random.setstate(ckpt.randomState)
+        self.scoreCache.update(ckpt.scores["source"])
+        self.fingerprintCache.update(ckpt.scores["fingerprint"])
+        self.objectCache.update(ckpt.scores["object"])
+        # edit keys are hashes, which differ between processes,
+        # and the mutators may have changed.
+        for member in ckpt.population:
+            member.edits, member.mutators = (), ()
+            member.parentScore = None
+        self._state = (ckpt.population, ckpt.generationNum,
+            ckpt.bestScore)
+        print(f"Resuming at generation {ckpt.generationNum + 1}, "
+            f"original score: {self.initialScore}")
+        return self._state
+
+    def prepareScoring(self) -> None:
+        """Open the score database and set up the pre-scorer, if
+        they're used. This must be done once the scored symbols
+        are known."""
+        if self.scoreDbPath is not None:
+            self.scoreDb = ScoreDatabase(self.scoreDbPath,
+                self.buildContext())
+        self.diffScorer = DiffScorer(self.scoreMetric)
+        if self.usePreScorer:
+            self.preScorer = PreScorer(self.targetObjPath,
+                self.scoreSymbols)
+
+    def buildContext(self) -> bytes:
+        """Return a digest of everything besides the code itself
+        that affects the score: the compiler flags, the compile
+        and score commands, and the target object."""
+        h = hashlib.blake2b(digest_size=16)
+        for part in (self.cflags,
+        buildCompileCommand(self.cflags, "in.c", "out.o"),
+        *(buildScoreCommand("target.o", "out.o", symbol)
+            for symbol in self.scoreSymbols or [None]),
+        [str(self.useFingerprints), self.scoreMetric]):
+            h.update("\0".join(map(str, part)).encode("utf-8"))
+            h.update(b"\1")
+        with open(self.targetObjPath, "rb") as file:
+            h.update(file.read())
+        return h.digest()
+
     def preprocess(self, srcPath: PathLike) -> str:
         """Preprocess the given source file.
 
         Returns preprocessed source.
         """
-        tmp = tempfile.NamedTemporaryFile()
+        tmp = tempfile.NamedTemporaryFile(suffix=".i", dir=self.tempDir)
         cmd = buildPreprocessCommand(self.cflags, srcPath, tmp.name)
         # print(' '.join(cmd))
         result = subprocess.run(cmd, capture_output=True)
-        # print(result.stdout.decode('utf-8'))
-        # print(result.stderr.decode('utf-8'))
-        return tmp.read()
+        if result.returncode != 0:
+            print(result.stdout.decode('utf-8'))
+            print(result.stderr.decode('utf-8'))
+            raise RuntimeError("Preprocessing failed")
+        # the compiler may have replaced the file, so reopen it
+        with open(tmp.name, "r") as file:
+            return file.read()
+
+    def mapLineRange(self, code:str, srcPath:PathLike,
+    lines:tuple[int,int]) -> tuple[int,int]:
+        """Find where a line range of a source file ended up in
+        its preprocessed code, using the line markers.
 
-    def compileObj(self, src: str | list[Token]) -> \
-    tempfile.NamedTemporaryFile:
+        :param code: The preprocessed code.
+        :param srcPath: The file that was preprocessed.
+        :param lines: First and last line in that file.
+        :returns: First and last line in the preprocessed code.
+        """
+        name = os.path.basename(srcPath)
+        lStart, lEnd = lines
+        found = []
+        inFile, lineNo = False, 0
+        for i, line in enumerate(code.split('\n')):
+            match = re_lineMarker.match(line)
+            if match:
+                lineNo = int(match.group(1))
+                inFile = os.path.basename(
+                    match.group(2).replace('\\', '/')) == name
+                continue
+            if inFile and lStart <= lineNo <= lEnd: found.append(i + 1)
+            lineNo += 1
+        if not found:
+            raise RuntimeError("Can't find the line range in "
+                "the preprocessed code")
+        return found[0], found[-1]
+
+    def setOriginal(self, member:Candidate) -> None:
+        """Set the original code, and render the code outside its
+        window, which every member shares."""
+        self.originalSource = member
+        self._textBefore = self.parser.toString(member.before) \
+            .encode('utf-8')
+        self._textAfter = self.parser.toString(member.after) \
+            .encode('utf-8')
+        canon = Canonicalizer()
+        canon.feed(member.before)
+        self._keysBefore = (self.digest(self._textBefore),
+            self.digest(canon.text().encode('utf-8')), canon.state())
+        self._keysAfter = (self.digest(self._textAfter), {})
+        self.syntaxChecker = None
+        if self.useSyntaxCheck:
+            checker = SyntaxChecker(member.before, member.window,
+                member.after)
+            if checker.problem is None: self.syntaxChecker = checker
+            else: print("Not checking syntax:", checker.problem)
+
+    async def compileObj(self, src: str | list[Token] | Candidate) -> \
+    tuple[tempfile.NamedTemporaryFile, str, str, float]:
         """Compile the given source code.
 
+        A Candidate is written straight to the compiler's input
+        file, using the code shared by all members as-is.
+
         On success, returns an object file, the compiler stdout,
-        and the compiler stderr.
-        On failure, returns None, the compiler stdout,
-        and the compiler stderr.
+        the compiler stderr, and how many seconds compiling took.
+        On failure, returns None instead of the object file.
         """
         if type(src) is list: src = self.parser.toString(src)
         #print(src)
-        tmpIn = tempfile.NamedTemporaryFile(suffix=".c")
-        tmpIn.write(bytes(src, "utf-8"))
+        tmpIn = tempfile.NamedTemporaryFile(suffix=".c", dir=self.tempDir)
+        if type(src) is Candidate:
+            tmpIn.write(self._textBefore)
+            tmpIn.write(self.parser.toString(src.window).encode('utf-8'))
+            tmpIn.write(self._textAfter)
+        else: tmpIn.write(bytes(src, "utf-8"))
+        tmpIn.flush()
 
-        tmpOut = tempfile.NamedTemporaryFile(suffix=".o")
-        cmd = buildCompileCommand(self.cflags, tmpIn.name, tmpOut.name)
-        try:
-            result = subprocess.run(cmd, capture_output=True, check=False)
-        except subprocess.CalledProcessError:
-            return None, None, None
-        if result.returncode != 0:
+        tmpOut = tempfile.NamedTemporaryFile(suffix=".o", dir=self.tempDir)
+        if self.batchCompiler is not None:
+            returncode, stdout, stderr, seconds = \
+                await self.batchCompiler.compile(tmpIn.name, tmpOut.name)
+        else:
+            cmd = buildCompileCommand(self.cflags, tmpIn.name, tmpOut.name)
+            returncode, stdout, stderr, seconds = \
+                await self.evaluator.runProcess(cmd,
+                    self.evaluator.compileStage)
+        if self._tempOnDisk:
+            self.countDiskWrite(tmpIn.tell() +
+                os.path.getsize(tmpOut.name))
+        if returncode != 0:
             tmpOut = None
-        return tmpOut, result.stdout.decode('utf-8'), \
-            result.stderr.decode('utf-8')
+        return (tmpOut, stdout.decode('utf-8'), stderr.decode('utf-8'),
+            seconds)
+
+    def sourceKey(self, code: str | list[Token]) -> bytes:
+        """Return the digest used to identify this code in the
+        score cache."""
+        if type(code) is list: code = self.parser.toString(code)
+        return self.digest(code.encode("utf-8"))
+
+    def digest(self, data:bytes) -> bytes:
+        """Return the digest used for cache keys."""
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def objectKey(self, objFile: tempfile.NamedTemporaryFile) -> bytes:
+        """Return the digest used to identify this object file in
+        the object cache.
 
-    def fitness(self, code: list[Token]) -> int:
+        The name of the temporary source file ends up in the debug
+        info, so it's masked out; otherwise no two candidates would
+        ever produce the same object.
+        """
+        with open(objFile.name, "rb") as file:
+            data = file.read()
+        data = re_tempSourceName.sub(b'tmp________.c', data)
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def cacheKeys(self, member: Candidate) -> tuple[bytes, bytes]:
+        """Compute a member's cache keys.
+
+        Only the window is rendered; the code around it is the
+        same for every member, so its digests are reused.
+
+        :returns: The digest for the score cache and the fingerprint
+            for the fingerprint cache. If useFingerprints is
+            disabled, the fingerprint is the same as the digest.
+        """
+        keyBefore, fpBefore, state = self._keysBefore
+        keyAfter, fpsAfter = self._keysAfter
+        window = self.parser.toString(member.window).encode('utf-8')
+        key = self.digest(keyBefore + window + keyAfter)
+        if not self.useFingerprints: return key, key
+
+        canon = Canonicalizer(state)
+        canon.feed(member.window)
+        # the canonical form of the code after the window depends
+        # on how the window ends, but there aren't many ways it can.
+        state = canon.state()
+        fpAfter = fpsAfter.get(state)
+        if fpAfter is None:
+            after = Canonicalizer(state)
+            after.feed(member.after)
+            fpAfter = self.digest(after.text().encode('utf-8'))
+            fpsAfter[state] = fpAfter
+        fp = self.digest(fpBefore + canon.text().encode('utf-8') + fpAfter)
+        return key, fp
+
+    def cachedScore(self, key:bytes, fp:bytes) -> float | None:
+        """Look up a score in the caches.
+
+        :returns: The score, or None if this code hasn't been
+            scored yet.
+        """
+        score = self.scoreCache.get(key)
+        if score is None and self.useFingerprints:
+            score = self.fingerprintCache.get(fp)
+            if score is not None: self.scoreCache.put(key, score)
+        if score is None and self.scoreDb is not None:
+            score = self.scoreDb.get(fp)
+            if score is not None:
+                self.scoreCache.put(key, score)
+                if self.useFingerprints:
+                    self.fingerprintCache.put(fp, score)
+        return score
+
+    def storeScore(self, key:bytes, fp:bytes, score:float) -> None:
+        """Record a score in the caches."""
+        # estimates depend on the current triage threshold and
+        # selection cutoff, so they're worked out again next time.
+        if isEstimate(score): return
+        self.scoreCache.put(key, score)
+        if self.useFingerprints: self.fingerprintCache.put(fp, score)
+        if self.scoreDb is not None: self.scoreDb.put(fp, score)
+
+    def fitness(self, member: Candidate) -> int:
         """Determine how closely this code matches the desired binary.
 
         Returns an arbitrary number where lower means more closely
         matching, with 0 meaning a perfect match, and Infinity
         meaning the compile failed.
+
+        Code that was scored before isn't compiled again.
         """
-        code = self.parser.toString(code)
-        # Write the source code to a file
-        with open(self.sourceFilePath, "w") as f:
-            f.write(code)
+        key, fp = self.cacheKeys(member)
+        score = self.cachedScore(key, fp)
+        if score is None:
+            score, _ = self.evaluator.run(self.scoreSource(member))
+            self.storeScore(key, fp, score)
+        return score
+
+    async def scoreSource(self,
+    code: str | list[Token] | Candidate) -> tuple[float, float]:
+        """Compile and score the given code, without using the
+        source caches.
+
+        Returns the score, and how many seconds the compile and
+        score processes ran.
 
-        # display diff
-        #print('\x1B[2J', end='') # clear screen
-        #subprocess.call(['diff', '-y', '--suppress-common-lines',
-        #    origSourcePath, sourceFilePath])
+        If the code compiles to an object that was already scored,
+        that score is reused instead of running the score command.
 
+        Many of these run at once, so it must not touch any shared
+        files; compileObj() gives each call its own temporary files.
+        """
         # Compile the source code to a binary
-        objFile, _, __ = self.compileObj(code)
+        objFile, _, __, seconds = await self.compileObj(code)
         if objFile is None:
-            return Infinity  # compile failed
+            return Infinity, seconds  # compile failed
+
+        key = self.objectKey(objFile)
+        score = self.objectCache.get(key)
+        if score is not None: return score, seconds
+
+        # mutating the function's header can rename it, and the
+        # score command can't compare a symbol that isn't there.
+        if self.scoreSymbols:
+            try: functions = ElfFile.load(objFile.name).functions()
+            except ValueError: return Infinity, seconds
+            if any(name not in functions for name in self.scoreSymbols):
+                return Infinity, seconds
+
+        # skip the score command if it's clearly not good enough.
+        # a distance of 0 is always confirmed.
+        distance = None
+        if self.preScorer is not None:
+            distance = self.preScorer.distance(objFile.name)
+            if distance > self.triageThreshold:
+                self.numTriaged += 1
+                return TriagePenalty + distance, seconds
 
         # Compare the generated binary with the target binary
-        cmd = buildScoreCommand(self.targetObjPath, objFile.name)
-        result = subprocess.run(cmd, capture_output=True, check=False)
-        if result.returncode != 0:
-            raise RuntimeError("Scoring failed: " +
-                result.stdout.decode('utf-8') + '\n' +
-                result.stderr.decode('utf-8'))
-        return len(result.stdout)
+        score = 0
+        for symbol in self.scoreSymbols or [None]:
+            cmd = buildScoreCommand(self.targetObjPath, objFile.name,
+                symbol)
+            partial, complete, scoreSeconds = await self.diffScorer.score(
+                cmd, self.evaluator.scoreStage,
+                self.selectionCutoff - score)
+            score += partial
+            seconds += scoreSeconds
+            if not complete: # already too bad to be selected
+                return TriagePenalty + score, seconds
+        self.objectCache.put(key, score)
+        if distance is not None:
+            self._triageSamples.append((distance, score))
+        return score, seconds
 
     def select(self, population):
         """Choose the best-performing individuals based on the
         fitness function."""
         scores = {}
+        pending = {} # fingerprint => (member, key) that needs scoring
+        waiting = {} # fingerprint => members with that code
+        audits  = set() # fingerprints that failed the syntax check
+        seen = set()
         for member in population:
-            mid = id(member)
-            if mid not in scores:  # don't re-score duplicate members
-                scores[mid] = self.fitness(member)
-                print("#" if math.isfinite(scores[mid]) else '*',
-                    end="", flush=True)
-            else: print('.', end="", flush=True)
+            if id(member) in seen: # don't re-score duplicate members
+                print('.', end="", flush=True)
+                continue
+            seen.add(id(member))
+            key, fp = self.cacheKeys(member)
+            if fp in pending: # equivalent to another member
+                waiting[fp].append(member)
+                print('.', end="", flush=True)
+                continue
+            score = self.cachedScore(key, fp)
+            if score is not None:
+                scores[id(member)] = score
+                print('.', end="", flush=True)
+            elif self.syntaxChecker is not None and not self.checkSyntax(
+            member, fp, audits):
+                # not remembered, in case the checker is wrong
+                scores[id(member)] = Infinity
+                self.recordResult(member, Infinity, 0)
+                print('-', end="", flush=True)
+            else:
+                pending[fp] = (member, key)
+                waiting[fp] = [member]
+
+        async def evaluate(fp):
+            try: return await self.scoreSource(pending[fp][0])
+            except ProcessTimeout: return None
+            except RuntimeError as ex:
+                # one odd candidate shouldn't stop the run
+                print(ex)
+                return None
+
+        for fp, result in self.evaluator.evaluate(evaluate, list(pending)):
+            # a timeout may be the machine being busy, and a failed
+            # score command may be a problem with the command, so
+            # neither is remembered.
+            timedOut = result is None
+            if timedOut: score, seconds = Infinity, 0
+            else:
+                score, seconds = result
+                self.storeScore(pending[fp][1], fp, score)
+            if fp in audits:
+                self.numSyntaxAudited += 1
+                if math.isfinite(score): self.numFalseRejects += 1
+            # the work was only done once for all of them
+            seconds /= len(waiting[fp])
+            for member in waiting[fp]:
+                scores[id(member)] = score
+                if not timedOut: self.recordResult(member, score, seconds)
+            print("#" if math.isfinite(score) else '*',
+                end="", flush=True)
+            # leaving the loop cancels the rest and kills their
+            # processes.
+            if self.checkStop(score): break
         print(" ", end="", flush=True)
+        # members not scored because the run is stopping
+        for member in population: scores.setdefault(id(member), Infinity)
+        if self.scoreDb is not None: self.scoreDb.flush()
 
         k = lambda code: scores[id(code)]
         population = sorted(population, key=k)[: len(population) // 3]
+        self.selectionCutoff = scores[id(population[-1])]
+        if self.preScorer is not None:
+            self.updateTriageThreshold(scores[id(population[-1])])
         return population, scores
 
-    def crossover(self, parent1, parent2):
+    def recordResult(self, member:Candidate, score:float,
+    seconds:float) -> None:
+        """Record how the mutations that made a member did.
+
+        :param member: The member.
+        :param score: Its score, Infinity if it didn't compile.
+        :param seconds: How long compiling and scoring it took.
+        """
+        compiled = math.isfinite(score)
+        if self.mutator.failures is not None and member.edits:
+            self.mutator.failures.record(member.edits, not compiled)
+        if self.mutator.scheduler is not None and member.mutators:
+            improved = (member.parentScore is not None
+                and not isEstimate(score) and score < member.parentScore)
+            self.mutator.scheduler.record(member.mutators, compiled,
+                improved, seconds)
+
+    def syntaxRejectRate(self, checked:int, rejected:int) -> float:
+        """Return the share of candidates the syntax checker
+        rejected since it had checked and rejected the given
+        numbers."""
+        return ((self.numSyntaxRejected - rejected)
+            / max(1, self.numSyntaxChecked - checked))
+
+    def checkSyntax(self, member:Candidate, fp:bytes,
+    audits:set[bytes]) -> bool:
+        """Check whether a member might compile.
+
+        Every syntaxAuditInterval'th member that fails the check
+        is compiled anyway, and its fingerprint added to audits.
+
+        :returns: Whether to compile it.
+        """
+        self.numSyntaxChecked += 1
+        if self.syntaxChecker.check(
+        self.parser.toString(member.window)) is None:
+            return True
+        self.numSyntaxRejected += 1
+        if self.numSyntaxRejected % self.syntaxAuditInterval: return False
+        audits.add(fp)
+        return True
+
+    def updateTriageThreshold(self, cutoff:float) -> None:
+        """Set the pre-scorer distance above which candidates don't
+        get a real score, based on the distances of this generation's
+        candidates that scored well enough to be selected.
+
+        :param cutoff: The score of the worst selected member.
+        """
+        samples, self._triageSamples = self._triageSamples, []
+        distances = [d for d, s in samples if s <= cutoff]
+        if distances:
+            # never below 1, or only exact matches would be scored
+            self.triageThreshold = max(max(distances), 1) * self.triageMargin
+
+    def crossover(self, parent1:Candidate,
+    parent2:Candidate) -> Candidate:
         """Combine parts of two or more source code snippets to
         create new individuals."""
-        splitPos = random.randint(1, len(parent1))
-        result = parent1[0:splitPos] + parent2[splitPos:]
-        return result
+        # only the windows differ, so that's where to split.
+        splitPos = random.randint(1, len(parent1.window))
+        return parent1.withWindow(
+            parent1.window[0:splitPos] + parent2.window[splitPos:])
 
     def tokenize(self, code):
         tokens = self.parser.parse(code)
         return tokens
 
-    def mutate(self, tokens):
-        lStart, lEnd = self.permuteLineRange
+    def reduceToFunction(self, tokens:list[Token],
+    lines:tuple[int,int]) -> tuple[list[Token], str]:
+        """Reduce the code to its declarations and the function
+        containing the given lines.
+
+        The other functions are replaced by prototypes. Since
+        they're no longer defined here, `static` is removed from
+        them and from their other prototypes. Inline functions are
+        kept so they can still be inlined. Line breaks are kept, so
+        line numbers don't change.
+
+        :returns: The reduced code and the function's name.
+        """
+        lStart, lEnd = lines
+        functions = self.parser.findFunctions(tokens)
+        target = next((f for f in functions if
+            tokens[f[1]].line <= lEnd and tokens[f[3]-1].line >= lStart),
+            None)
+        if target is None or target[0] is None:
+            raise RuntimeError("No function found in the line range")
+
+        isStatic = lambda t: t.type == TokenType.KEYWORD and t.value == 'static'
+        result, pos = [], 0
+        replaced = set()
+        for function in functions:
+            name, iStart, iOpen, iEnd = function
+            header = tokens[iStart:iOpen]
+            if function is target or any(t.type == TokenType.KEYWORD
+            and t.value in ('inline', '__inline') for t in header):
+                continue
+            replaced.add(name)
+            result += tokens[pos:iOpen]
+            # replace the body with `;` and the same number of lines
+            body = self.parser.toString(tokens[iOpen:iEnd-1])
+            end = Token(';')
+            end._type = TokenType.SPECIAL_SYMBOL
+            end._line, end._column = tokens[iOpen].line, tokens[iOpen].column
+            end._trailingWhitespace = ('\n' * body.count('\n') +
+                tokens[iEnd-1].trailingWhitespace)
+            result.append(end)
+            pos = iEnd
+        result += tokens[pos:]
+
+        # find the `static`s in the top-level declarations of the
+        # replaced functions
+        drop = set()
+        depth, start = 0, 0
+        lineStart, directive = True, False
+        for i, token in enumerate(result):
+            first, lineStart = lineStart, ('\n' in token.trailingWhitespace
+                or token.isLineComment())
+            if directive or (token.value == '#' and first):
+                # skip preprocessor lines, unless continued
+                directive = not lineStart or token.value == '\\'
+                start = i + 1
+                continue
+            if token.type != TokenType.SPECIAL_SYMBOL: continue
+            if token.value == '{': depth += 1
+            elif token.value == '}':
+                depth = max(depth - 1, 0)
+                if depth == 0: start = i + 1
+            elif token.value == ';' and depth == 0:
+                decl = result[start:i]
+                if any(t.type == TokenType.IDENTIFIER and t.value in replaced
+                and u.value == '(' for t, u in zip(decl, decl[1:])):
+                    drop.update(j for j in range(start, i)
+                        if isStatic(result[j]))
+                start = i + 1
+        if not drop: return result, target[0]
+
+        reduced = []
+        for i, token in enumerate(result):
+            if i not in drop: reduced.append(token)
+            elif '\n' in token.trailingWhitespace and reduced:
+                # keep the line break
+                prev = Token(reduced[-1])
+                prev._trailingWhitespace += token.trailingWhitespace
+                reduced[-1] = prev
+        return reduced, target[0]
+
+    def findFullSource(self, tokens:list[Token],
+    lines:tuple[int,int]) -> Candidate | None:
+        """Find the original window in the code before it was
+        reduced to one function.
+
+        :returns: The whole code, or None if the window also
+            covers parts of the code that were reduced.
+        """
+        full = Candidate.fromTokens(tokens, *self.findWindow(tokens, lines))
+        if (self.parser.toString(full.window)
+        != self.parser.toString(self.originalSource.window)):
+            print("The line range reaches outside the function, "
+                "so best.c will only have that function")
+            return None
+        return full
+
+    def findSymbols(self, tokens:list[Token],
+    lines:tuple[int,int]) -> list[str] | None:
+        """Find the functions in the target object that are
+        defined in the given line range.
 
-        # find which tokens belong to this line range
+        :returns: Their names, or None if there aren't any (so
+            the whole object should be scored).
+        """
+        lStart, lEnd = lines
+        result = [name for name, iStart, _, iEnd
+            in self.parser.findFunctions(tokens)
+            if tokens[iStart].line <= lEnd
+            and tokens[iEnd-1].line >= lStart
+            and name in self.targetSymbols]
+        return result or None
+
+    def findWindow(self, tokens:list[Token],
+    lines:tuple[int,int]=None) -> tuple[int, int]:
+        """Find which tokens belong to a line range.
+
+        :param tokens: The code.
+        :param lines: The first and last line, by default
+            permuteLineRange.
+        :returns: The index of the first token and the index
+            after the last token.
+        """
+        lStart, lEnd = lines or self.permuteLineRange
         iFirst, iLast = 0, 0
         for i, token in enumerate(tokens):
             if token.line < lStart:
@@ -256,17 +1167,27 @@ class App:
                 iLast = i + 1  # range is exclusive
             else:
                 break
-        if iLast <= iFirst: return None
+        if iLast <= iFirst: return 0, 0
+        return iFirst, iLast
+
+    def mutate(self, member:Candidate,
+    parentScore:float=None) -> Candidate | None:
+        """Make random changes to a member's window.
 
-        change = tokens[iFirst:iLast]
-        assert len(change) > 1
+        :param parentScore: The score the new member must beat
+            to count as an improvement, if known.
+        :returns: The new member, or None if mutating failed.
+        """
+        if len(member.window) < 2: return None
         nMutations = random.randint(1, self.mutationRate)
         try:
-            mutated = self.mutator.mutate(change, nMutations)
+            # this doesn't change the window
+            mutated = self.mutator.mutate(member.window, nMutations)
         except Exception as ex:
             print("Error during mutation", ex)
             return None
-        return tokens[:iFirst] + mutated + tokens[iLast:]
+        return member.withWindow(mutated, tuple(self.mutator.edits),
+            tuple(self.mutator.used), parentScore)
 
     def generateInitialPopulation(self):
         """Generate initial population."""
@@ -275,39 +1196,56 @@ class App:
         code = ''
         with open(self.origSourcePath, "r") as file:
             code = file.read()
-            self.originalSource = self.tokenize(code)
-            assert len(self.originalSource) > 1
-            # keep the original code as one member
-            population.append(self.originalSource)
+        self.originalKey = self.sourceKey(code)
+        lines = self.permuteLineRange
+        if self.usePreprocessed:
+            code = self.preprocess(self.origSourcePath)
+            lines = self.mapLineRange(code, self.origSourcePath, lines)
+        tokens = self.tokenize(code)
 
         # sanity check
-        #if parser.toString(self.originalSource) != code:
-        #    with open('fail.c', 'w') as file:
-        #        file.write(parser.toString(self.originalSource))
-        #    raise RuntimeError("Parser bug")
+        if self.parser.toString(tokens) != code:
+            with open('fail.c', 'w') as file:
+                file.write(self.parser.toString(tokens))
+            raise RuntimeError("Parser bug")
+
+        if self.useFunctionScope:
+            fullTokens = tokens
+            tokens, name = self.reduceToFunction(tokens, lines)
+            print("Compiling only function", name)
+            self.scoreSymbols = [name]
+        elif not self.scoreWholeObject:
+            self.scoreSymbols = self.findSymbols(tokens, lines)
+        if self.scoreSymbols:
+            print("Scoring only", ", ".join(self.scoreSymbols))
+        self.prepareScoring()
 
-        assert len(self.originalSource) > 1
-        objFile, stdout, stderr = self.compileObj(self.originalSource)
+        iFirst, iLast = self.findWindow(tokens, lines)
+        if iLast - iFirst < 2:
+            raise RuntimeError("Not enough code in the line range")
+        self.setOriginal(Candidate.fromTokens(tokens, iFirst, iLast))
+        if self.useFunctionScope:
+            self.fullSource = self.findFullSource(fullTokens, lines)
+        # keep the original code as one member
+        population.append(self.originalSource)
+
+        objFile, stdout, stderr, _ = self.evaluator.run(
+            self.compileObj(tokens))
         if objFile is None:
             print("Initial compile failed")
             print(stdout)
             print(stderr)
             raise RuntimeError("Initial compile failed")
 
-        assert len(self.originalSource) > 1
-
         self.initialScore = self.fitness(self.originalSource)
-        assert len(self.originalSource) > 1
         if math.isinf(self.initialScore):
             raise RuntimeError("Initial score failed")
         print("Original score:", self.initialScore)
 
-        for i in range(self.populationSize - 1):
-            assert len(self.originalSource) > 1
-            code = self.mutate(self.originalSource)
-            assert len(code) > 1
-            population.append(code)
-            print("Generating %d/%d   " % (i + 1,
+        while len(population) < self.populationSize:
+            child = self.mutate(self.originalSource, self.initialScore)
+            if child: population.append(child)
+            print("Generating %d/%d   " % (len(population),
                 self.populationSize), end="\r")
         print("")
         return population
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# Measures the memory used by a full population of a large source.
+# Run from the repo root: python -m bench.memory
+import random
+import tracemalloc
+from app import App
+from app.Candidate import Candidate
+from bench.parse import makeSource
+
+def main():
+    random.seed(1)
+    app = App()
+    code = makeSource(16000)
+    app.setPermuteLineRange(8000, 8010)
+
+    tracemalloc.start()
+    tokens = app.tokenize(code)
+    parsed = tracemalloc.get_traced_memory()[0]
+    original = Candidate.fromTokens(tokens, *app.findWindow(tokens))
+    population = [original]
+    while len(population) < app.populationSize:
+        child = app.mutate(original)
+        if child: population.append(child)
+    total = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{len(tokens)} tokens, {code.count(chr(10))} lines, "
+        f"{len(population)} members")
+    print(f"parsed:     {parsed/1e6:7.2f} MB "
+        f"({parsed/len(tokens):6.1f} bytes/token)")
+    print(f"population: {total/1e6:7.2f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# Measures how mutating scales with the size of the permuted window.
+# Run from the repo root: python -m bench.mutate
+import random
+import time
+from app import App
+from app.Candidate import Candidate
+from bench.parse import makeSource
+
+def main():
+    tokens = App().tokenize(makeSource(4000))
+    print(" lines  tokens   us/mutation")
+    for nLines in (10, 100, 1000):
+        random.seed(1)
+        app = App()
+        app.setPermuteLineRange(1000, 1000 + nLines)
+        original = Candidate.fromTokens(tokens, *app.findWindow(tokens))
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 2:
+            app.mutate(original)
+            count += 1
+        elapsed = time.perf_counter() - start
+        print(f"{nLines:6d} {len(original.window):7d} "
+            f"{elapsed / count * 1e6:13.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# Measures how Parser.parse scales with the size of the source.
+# Run from the repo root: python -m bench.parse
+import time
+from parser import Parser
+
+function = """
+/** Update object %(n)d.
+ */
+static int updateObject%(n)d(Object *obj, int frames) {
+    // move it
+    obj->pos.x += obj->vel.x * (float)frames;
+    if(obj->flags & 0x%(n)04X) {
+        printf("obj %%d: %%s\\n", %(n)d, "updated");
+    }
+    return obj->pos.x > 1.5f ? 1 : 0;
+}
+"""
+
+def makeSource(nLines:int) -> str:
+    """Generate a C source of about the given number of lines."""
+    result = []
+    nLinesPer = function.count('\n')
+    for n in range(max(1, nLines // nLinesPer)):
+        result.append(function % {'n': n})
+    return ''.join(result)
+
+def main():
+    parser = Parser()
+    print(" lines    bytes  tokens   time   us/line")
+    for nLines in (1000, 2000, 4000, 8000, 16000):
+        code = makeSource(nLines)
+        tStart = time.perf_counter()
+        tokens = parser.parse(code)
+        elapsed = time.perf_counter() - tStart
+        nLines = code.count('\n')
+        print(f"{nLines:6d} {len(code):8d} {len(tokens):7d} "
+            f"{elapsed:6.3f}s {elapsed*1e6/nLines:8.2f}")
+
+if __name__ == "__main__":
+    main()
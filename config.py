@@ -49,21 +49,25 @@ cflags = [
     f"-DVERSION={version_num}",
 ]
 
-# Not currently used.
+# Used with --preprocess. The output must keep the #line
+# directives, to find the permuted lines in it.
 def buildPreprocessCommand(cflags:list[str],
 inPath:str, outPath:str):
     return [
         "./build/tools/wibo",
         "build/compilers/GC/1.0/mwcceppc.exe",
         *cflags,
-        "-EP",  # preprocess and strip out #line directives
+        "-E",  # preprocess only, keeping #line directives
         "-o",
         outPath,
         inPath,
     ]
 
+# inPath may be a list, to compile several files at once;
+# outPath is then the directory to put their objects in, named
+# after the sources (tmpabc.c => tmpabc.o).
 def buildCompileCommand(cflags:list[str],
-inPath:str, outPath:str):
+inPath:str | list[str], outPath:str):
     return [
         "./build/tools/wibo",
         "build/compilers/GC/1.0/mwcceppc.exe",
@@ -71,14 +75,19 @@ inPath:str, outPath:str):
         "-c",  # compile only, do not link
         "-o",
         outPath,
-        inPath,
+        *([inPath] if type(inPath) is str else inPath),
     ]
 
-def buildScoreCommand(origPath:str, newPath:str):
+# If symbol is given, only that symbol should be compared. The
+# candidate is checked to define the symbol first. If the command
+# ignores it, the whole object is compared for each symbol, which
+# still ranks candidates the same way, only more slowly.
+def buildScoreCommand(origPath:str, newPath:str, symbol:str=None):
     return [
         "../objdiff/target/release/objdiff-cli",
         "diff",
         "-1", origPath,
         "-2", newPath,
         "-o", "-",
+        *([symbol] if symbol else []),
     ]
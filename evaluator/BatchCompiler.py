@@ -0,0 +1,162 @@
+from __future__ import annotations
+from os import PathLike
+import asyncio
+import math
+import os
+import shutil
+import tempfile
+from .Stage import ProcessTimeout
+
+class BatchCompiler:
+    """Compiles many sources with one compiler process, so that
+    the compiler's startup time is paid once per batch instead of
+    once per source.
+
+    Sources queued in the same event loop iteration are compiled
+    together.
+    """
+
+    def __init__(self, evaluator, buildCommand:callable,
+    batchSize:int, tempDir:PathLike=None):
+        """Instantiate BatchCompiler.
+
+        :param evaluator: The Evaluator to run the compiler with.
+        :param buildCommand: Function taking a list of source paths
+            and an output directory, and returning the command to
+            compile them.
+        :param batchSize: Most sources to compile at once.
+        :param tempDir: Where to put the output directories.
+        """
+        self.evaluator    = evaluator
+        self.buildCommand = buildCommand
+        self.batchSize    = batchSize
+        self.tempDir      = tempDir
+        self._queue = [] # (inPath, outPath, future)
+
+    async def compile(self, inPath:PathLike,
+    outPath:PathLike) -> tuple[int, bytes, bytes, float]:
+        """Compile one source as part of a batch.
+
+        :param inPath: The source file.
+        :param outPath: Where to put the object file.
+        :returns: The return code, stdout, stderr, and this
+            source's share of the batch's compile time.
+        """
+        loop = asyncio.get_running_loop()
+        if not self._queue: loop.call_soon(self._flush)
+        future = loop.create_future()
+        self._queue.append((inPath, outPath, future))
+        return await future
+
+    def _flush(self) -> None:
+        """Start compiling everything in the queue."""
+        queue, self._queue = self._queue, []
+        queue = [item for item in queue if not item[2].done()]
+        if not queue: return
+        # smaller batches if there aren't enough to keep every
+        # worker busy.
+        size = min(self.batchSize,
+            math.ceil(len(queue) / self.evaluator.numWorkers))
+        for i in range(0, len(queue), size):
+            self.evaluator.spawn(self._run(queue[i:i+size]))
+
+    async def _run(self, batch:list) -> None:
+        """Compile a batch and deliver the results."""
+        try:
+            while batch: batch = await self._compileBatch(batch)
+        except Exception as ex:
+            for _, __, future in batch:
+                if not future.done(): future.set_exception(ex)
+        except asyncio.CancelledError:
+            for _, __, future in batch: future.cancel()
+            raise
+
+    async def _compileBatch(self, batch:list) -> list:
+        """Compile a batch once, and deliver the results that are
+        known.
+
+        The compiler only writes the objects of the sources that
+        compile, so every object it wrote is delivered. A source
+        without one failed if the compiler's output names it, and
+        gets the output about it. The others weren't reached, since
+        the compiler stopped early, and must be compiled again. If
+        no source without an object is named, the first one gets
+        all of the output, so that the batch always gets smaller.
+
+        If the compiler times out, the first source without an
+        object is the one it got stuck on.
+
+        :returns: The sources to compile again.
+        """
+        outDir = tempfile.mkdtemp(dir=self.tempDir)
+        try:
+            cmd = self.buildCommand([item[0] for item in batch], outDir)
+            timeout = None
+            try:
+                returncode, stdout, stderr, seconds = \
+                    await self.evaluator.runProcess(cmd,
+                        self.evaluator.compileStage, len(batch))
+            except ProcessTimeout as ex:
+                returncode, stdout, stderr, timeout = None, b'', b'', ex
+            share = 0 if timeout else seconds / len(batch)
+
+            names = [os.path.basename(item[0]).lower().encode()
+                for item in batch]
+            outs = self._splitOutput(stdout, names)
+            errs = self._splitOutput(stderr, names)
+            missing = []
+            for i, (_, outPath, future) in enumerate(batch):
+                name = os.path.splitext(os.path.basename(batch[i][0]))[0]
+                objPath = os.path.join(outDir, name + ".o")
+                if not os.path.exists(objPath): missing.append(i)
+                else:
+                    os.replace(objPath, outPath)
+                    if not future.done():
+                        future.set_result((0, outs.get(i, b''),
+                            errs.get(i, b''), share))
+        finally:
+            shutil.rmtree(outDir, ignore_errors=True)
+
+        if not missing: return []
+        if timeout is not None:
+            future = batch[missing[0]][2]
+            if not future.done(): future.set_exception(timeout)
+            return [batch[i] for i in missing[1:]]
+
+        failed = [i for i in missing if i in outs or i in errs]
+        if not failed:
+            outs, errs = {missing[0]: stdout}, {missing[0]: stderr}
+            failed = missing[:1]
+        for i in failed:
+            future = batch[i][2]
+            if not future.done():
+                future.set_result((returncode or 1, outs.get(i, b''),
+                    errs.get(i, b''), share))
+        return [batch[i] for i in missing if i not in failed]
+
+    @staticmethod
+    def _splitOutput(output:bytes, names:list[bytes]) -> dict[int, bytes]:
+        """Split compiler output by the source it's about.
+
+        Each line belongs to the last source named before it, or
+        the first one named after it if there's none before.
+
+        :param output: The compiler output.
+        :param names: The sources' file names, in lower case.
+        :returns: Each named source's lines, by index in `names`.
+        """
+        result = {}
+        current, pending = None, []
+        for line in output.splitlines(keepends=True):
+            lower = line.lower()
+            for i, name in enumerate(names):
+                if name in lower:
+                    current = i
+                    break
+            if current is None: pending.append(line)
+            else:
+                if pending:
+                    line = b''.join(pending) + line
+                    pending = []
+                result[current] = result.get(current, b'') + line
+        return result
@@ -0,0 +1,109 @@
+from __future__ import annotations
+import asyncio
+import math
+import re
+import time
+from . import startProcess, killProcess
+from .Stage import Stage, ProcessTimeout
+
+Infinity = float("inf")
+
+# one instruction row of objdiff's JSON output. rows that match
+# have no diff kind at all, or DIFF_NONE. the field is diffKind
+# in protobuf JSON and diff_kind in older versions.
+re_diffKind = re.compile(rb'"diff(?:_k|K)ind"\s*:\s*"(DIFF_[A-Z_]+)"')
+
+class DiffScorer:
+    """Runs the score command and turns its output into a score
+    while it's being written, so that it can be stopped as soon
+    as the score is known to be too high.
+
+    The metrics are:
+    - `length`: the number of bytes of output, which works with
+      any output format.
+    - `mismatches`: the number of instruction rows that differ
+      (objdiff's JSON output, on both sides of the diff).
+    """
+
+    metrics = ('length', 'mismatches')
+    """The supported metrics."""
+
+    chunkSize: int = 65536
+    """How much output to read at once."""
+
+    def __init__(self, metric:str='length'):
+        """Instantiate DiffScorer.
+
+        :param metric: Which metric to compute.
+        """
+        if metric not in self.metrics:
+            raise ValueError(f"Unknown score metric: {metric}")
+        self.metric = metric
+
+    async def score(self, cmd:list[str], stage:Stage,
+    limit:float=Infinity) -> tuple[int, bool, float]:
+        """Run a score command and score its output.
+
+        :param cmd: The command to run.
+        :param stage: The stage to run the command in.
+        :param limit: Stop once the score is above this.
+        :returns: The score, whether it's complete, and how many
+            seconds the command ran. If the score isn't complete,
+            the real score is above the limit, and the returned
+            score is the limit plus one, so that it doesn't depend
+            on how the output happened to be split into chunks.
+        :raises RuntimeError: If the command fails, or its output
+            has no instruction rows to count mismatches in.
+        :raises ProcessTimeout: If the command took too long.
+        """
+        async with stage.slots:
+            proc = await startProcess(cmd)
+            start = time.monotonic()
+            errors = asyncio.ensure_future(proc.stderr.read())
+            try:
+                score = await asyncio.wait_for(
+                    self._readScore(proc.stdout, limit), stage.timeout())
+            except asyncio.TimeoutError:
+                stage.numTimeouts += 1
+                raise ProcessTimeout(f"{stage.name} timed out")
+            finally:
+                # stopped early, failed, or cancelled
+                if proc.returncode is None and not proc.stdout.at_eof():
+                    killProcess(proc)
+                await proc.wait()
+                errors = await errors
+            seconds = time.monotonic() - start
+            # stopping early says nothing about how long a full run takes
+            if score <= limit: stage.record(seconds)
+        if score > limit: return math.floor(limit) + 1, False, seconds
+        if proc.returncode != 0:
+            raise RuntimeError("Scoring failed: " +
+                errors.decode('utf-8', 'replace'))
+        return score, True, seconds
+
+    async def _readScore(self, stream:asyncio.StreamReader,
+    limit:float) -> int:
+        """Read a score command's output until the end, or until
+        the score is above the limit."""
+        score = 0
+        numRows, numBytes = 0, 0
+        tail = b'' # end of the last chunk, which may hold part of a row
+        while score <= limit:
+            chunk = await stream.read(self.chunkSize)
+            if not chunk: break
+            if self.metric == 'length':
+                score += len(chunk)
+                continue
+            numBytes += len(chunk)
+            data = tail + chunk
+            end = 0
+            for match in re_diffKind.finditer(data):
+                numRows += 1
+                if match.group(1) != b'DIFF_NONE': score += 1
+                end = match.end()
+            tail = data[max(end, len(data) - 64):]
+        # otherwise any other format would count as a match
+        if numBytes and not numRows:
+            raise RuntimeError("Score output has no instruction rows; "
+                "the mismatches metric needs objdiff's JSON output")
+        return score
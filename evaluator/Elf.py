@@ -0,0 +1,145 @@
+from __future__ import annotations
+from os import PathLike
+import mmap
+import struct
+
+SHT_SYMTAB = 2
+SHT_RELA   = 4
+SHT_REL    = 9
+STT_FUNC   = 2
+
+class Section:
+    """One section of an ELF file."""
+    __slots__ = ('index', 'name', 'type', 'offset', 'size', 'link',
+        'info', 'entsize')
+
+    def __init__(self, index:int, name:str, type:int, offset:int,
+    size:int, link:int, info:int, entsize:int):
+        self.index   = index
+        self.name    = name
+        self.type    = type
+        self.offset  = offset
+        self.size    = size
+        self.link    = link
+        self.info    = info
+        self.entsize = entsize
+
+class Symbol:
+    """One entry of an ELF symbol table."""
+    __slots__ = ('name', 'value', 'size', 'type', 'bind', 'section')
+
+    def __init__(self, name:str, value:int, size:int, type:int,
+    bind:int, section:int):
+        self.name    = name
+        self.value   = value
+        self.size    = size
+        self.type    = type
+        self.bind    = bind
+        self.section = section
+
+class ElfFile:
+    """Reads the sections and symbols of an ELF object file.
+
+    Only what's needed to compare objects is parsed; this isn't
+    a general ELF library.
+    """
+
+    def __init__(self, data:bytes | mmap.mmap):
+        """Parse the given file contents."""
+        if data[:4] != b'\x7FELF':
+            raise ValueError("Not an ELF file")
+        self.data  = data
+        self.is64  = data[4] == 2
+        self.order = '>' if data[5] == 2 else '<'
+        if self.is64:
+            shoff, = struct.unpack_from(self.order + 'Q', data, 0x28)
+            shentsize, shnum, shstrndx = struct.unpack_from(
+                self.order + 'HHH', data, 0x3A)
+            shFormat = 'IIQQQQIIQQ'
+        else:
+            shoff, = struct.unpack_from(self.order + 'I', data, 0x20)
+            shentsize, shnum, shstrndx = struct.unpack_from(
+                self.order + 'HHH', data, 0x2E)
+            shFormat = 'IIIIIIIIII'
+
+        headers = [struct.unpack_from(self.order + shFormat, data,
+            shoff + i * shentsize) for i in range(shnum)]
+        names = headers[shstrndx] if shnum else None
+        self.sections: list[Section] = []
+        for i, (name, typ, _, __, offset, size, link, info, ___,
+        entsize) in enumerate(headers):
+            self.sections.append(Section(i,
+                self._string(names[4], name), typ, offset, size,
+                link, info, entsize))
+        self._symbols = None
+
+    @classmethod
+    def load(cls, path:PathLike) -> ElfFile:
+        """Map an ELF file from disk into memory."""
+        with open(path, 'rb') as file:
+            try:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # empty file
+                raise ValueError("Not an ELF file")
+        return cls(data)
+
+    def _string(self, offset:int, index:int) -> str:
+        """Read a string from a string table."""
+        start = offset + index
+        end = self.data.find(b'\0', start)
+        return self.data[start:end].decode('utf-8', 'replace')
+
+    def sectionBytes(self, section:Section) -> bytes:
+        """Return the contents of a section."""
+        return self.data[section.offset:section.offset + section.size]
+
+    def symbolBytes(self, symbol:Symbol) -> bytes:
+        """Return the contents of a symbol in a relocatable
+        object, where its value is its offset in its section."""
+        section = self.sections[symbol.section]
+        start = section.offset + symbol.value
+        return self.data[start:start + symbol.size]
+
+    def relocatedOffsets(self, section:Section) -> set[int]:
+        """Return the offsets in a section that are changed by
+        relocations."""
+        result = set()
+        for rel in self.sections:
+            if rel.type not in (SHT_REL, SHT_RELA) or rel.info != section.index:
+                continue
+            fmt = self.order + ('Q' if self.is64 else 'I')
+            for offs in range(rel.offset, rel.offset + rel.size, rel.entsize):
+                result.add(struct.unpack_from(fmt, self.data, offs)[0])
+        return result
+
+    def symbols(self) -> list[Symbol]:
+        """Return the symbols of all symbol tables."""
+        if self._symbols is None:
+            self._symbols = []
+            for section in self.sections:
+                if section.type == SHT_SYMTAB:
+                    self._symbols += self._readSymbols(section)
+        return self._symbols
+
+    def _readSymbols(self, section:Section) -> list[Symbol]:
+        """Read one symbol table. The first entry is always
+        empty, so it's left out."""
+        strtab = self.sections[section.link].offset
+        result = []
+        for offs in range(section.offset + section.entsize,
+        section.offset + section.size, section.entsize):
+            if self.is64:
+                name, info, _, shndx, value, size = struct.unpack_from(
+                    self.order + 'IBBHQQ', self.data, offs)
+            else:
+                name, value, size, info, _, shndx = struct.unpack_from(
+                    self.order + 'IIIBBH', self.data, offs)
+            result.append(Symbol(self._string(strtab, name), value, size,
+                info & 0xF, info >> 4, shndx))
+        return result
+
+    def functions(self) -> dict[str, Symbol]:
+        """Return the defined function symbols by name."""
+        return {sym.name: sym for sym in self.symbols()
+            if sym.type == STT_FUNC
+            and 0 < sym.section < len(self.sections)}
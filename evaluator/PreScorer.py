@@ -0,0 +1,66 @@
+from __future__ import annotations
+from os import PathLike
+from difflib import SequenceMatcher
+from .Elf import ElfFile, Symbol
+
+Infinity = float("inf")
+
+class PreScorer:
+    """Cheaply estimates how far an object is from the target,
+    without running the score command.
+
+    The instructions of each function are compared word by word
+    (PowerPC instructions are all 4 bytes). Words changed by
+    relocations only keep their opcode, since the addresses
+    aren't known until linking.
+    """
+
+    wordSize: int = 4
+    """Size of one instruction."""
+
+    def __init__(self, targetPath:PathLike, symbols:list[str]=None):
+        """Instantiate PreScorer.
+
+        :param targetPath: The object file to match.
+        :param symbols: The functions to compare, or None for
+            all of them.
+        """
+        target = ElfFile.load(targetPath)
+        functions = target.functions()
+        if symbols is None: symbols = list(functions)
+        self._target = {name: self._words(target, functions[name])
+            for name in symbols if name in functions}
+
+    def distance(self, objPath:PathLike) -> int | float:
+        """Return the number of instructions that would have to be
+        added or removed to turn the object's code into the
+        target's. 0 means the functions match, except maybe for
+        the relocation targets, and Infinity means the object
+        couldn't be read."""
+        try: obj = ElfFile.load(objPath)
+        except ValueError: return Infinity
+        functions = obj.functions()
+        result = 0
+        for name, target in self._target.items():
+            sym = functions.get(name)
+            if sym is None:
+                result += len(target)
+                continue
+            words = self._words(obj, sym)
+            matcher = SequenceMatcher(None, target, words, autojunk=False)
+            matched = sum(b.size for b in matcher.get_matching_blocks())
+            result += len(target) + len(words) - 2 * matched
+        return result
+
+    def _words(self, elf:ElfFile, sym:Symbol) -> list[int]:
+        """Return a function's instructions, with relocated
+        ones masked."""
+        data = elf.symbolBytes(sym)
+        n = self.wordSize
+        order = 'big' if elf.order == '>' else 'little'
+        words = [int.from_bytes(data[i:i+n], order)
+            for i in range(0, len(data) - n + 1, n)]
+        for offs in elf.relocatedOffsets(elf.sections[sym.section]):
+            i = (offs - sym.value) // n
+            if 0 <= i < len(words): words[i] &= 0xFC000000
+        return words
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+
+class ScoreCache:
+    """Remembers the scores of code that was already evaluated.
+
+    Keys are digests of the code, so identical candidates are only
+    compiled once no matter which generation or parent they came
+    from. When the cache is full, the least recently used entry
+    is discarded.
+    """
+
+    maxSize: int = 100000
+    """Maximum number of scores to keep."""
+
+    hits: int = 0
+    """Number of lookups that found a score."""
+
+    misses: int = 0
+    """Number of lookups that found nothing."""
+
+    def __init__(self, maxSize:int=None):
+        if maxSize is not None: self.maxSize = maxSize
+        self._scores = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key:bytes) -> float | None:
+        """Look up a score.
+
+        :param key: The digest of the code.
+        :returns: The score, or None if it isn't known.
+        """
+        score = self._scores.get(key)
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._scores.move_to_end(key)
+        return score
+
+    def put(self, key:bytes, score:float) -> None:
+        """Record a score.
+
+        :param key: The digest of the code.
+        :param score: The code's score.
+        """
+        self._scores[key] = score
+        self._scores.move_to_end(key)
+        while len(self._scores) > self.maxSize:
+            self._scores.popitem(last=False)
+
+    def items(self) -> list[tuple[bytes, float]]:
+        """Return all known `(key, score)` pairs, least recently
+        used first."""
+        return list(self._scores.items())
+
+    def update(self, items:list[tuple[bytes, float]]) -> None:
+        """Record many scores, eg from items()."""
+        for key, score in items: self.put(key, score)
+
+    def hitRate(self) -> float:
+        """Return the fraction of lookups that found a score."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,95 @@
+from os import PathLike
+import math
+import sqlite3
+
+class ScoreDatabase:
+    """Keeps scores on disk so they survive between runs.
+
+    Several processes can share one database. Each score is stored
+    along with a context digest (of the compiler flags, commands and
+    target object), so changing any of those doesn't reuse scores
+    that no longer apply.
+
+    New scores are buffered and written in batches, since a commit
+    for every candidate would be slower than the compiles we're
+    trying to avoid.
+    """
+
+    batchSize: int = 100
+    """How many new scores to buffer before writing them."""
+
+    hits: int = 0
+    """Number of lookups that found a score."""
+
+    misses: int = 0
+    """Number of lookups that found nothing."""
+
+    def __init__(self, path:PathLike, context:bytes):
+        """Open the database.
+
+        :param path: Path to the database file, which is created
+            if it doesn't exist.
+        :param context: Digest identifying the build setup.
+        """
+        self.context = context
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path, timeout=30)
+        # let other processes read while we write
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS scores (
+            context BLOB NOT NULL,
+            key     BLOB NOT NULL,
+            score   REAL NOT NULL,
+            PRIMARY KEY (context, key)
+        ) WITHOUT ROWID""")
+        self._db.commit()
+
+    def get(self, key:bytes) -> float | None:
+        """Look up a score.
+
+        :param key: The fingerprint of the code.
+        :returns: The score, or None if it isn't known.
+        """
+        score = self._pending.get(key)
+        if score is None:
+            row = self._db.execute(
+                "SELECT score FROM scores WHERE context=? AND key=?",
+                (self.context, key)).fetchone()
+            if row is not None:
+                # scores are stored as REAL to allow Infinity
+                score = row[0]
+                if math.isfinite(score): score = int(score)
+        if score is None: self.misses += 1
+        else: self.hits += 1
+        return score
+
+    def put(self, key:bytes, score:float) -> None:
+        """Record a score. It's written to disk once enough
+        scores are buffered, or by flush().
+
+        :param key: The fingerprint of the code.
+        :param score: The code's score.
+        """
+        self._pending[key] = score
+        if len(self._pending) >= self.batchSize: self.flush()
+
+    def flush(self) -> None:
+        """Write buffered scores to disk."""
+        if not self._pending: return
+        self._db.executemany(
+            "INSERT OR REPLACE INTO scores VALUES (?, ?, ?)",
+            ((self.context, k, v) for k, v in self._pending.items()))
+        self._db.commit()
+        self._pending.clear()
+
+    def close(self) -> None:
+        """Write buffered scores and close the database."""
+        self.flush()
+        self._db.close()
+
+    def hitRate(self) -> float:
+        """Return the fraction of lookups that found a score."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
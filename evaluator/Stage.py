@@ -0,0 +1,63 @@
+from __future__ import annotations
+import asyncio
+import collections
+
+class ProcessTimeout(Exception):
+    """A subprocess took too long and was killed."""
+
+class Stage:
+    """One kind of subprocess the evaluator runs (compiling or
+    scoring): how many may run at once, how long they usually
+    take, and how long to wait before giving up on one.
+
+    The timeout adapts to the observed run times, so that a
+    mutation that makes the compiler hang doesn't stall the
+    whole generation.
+    """
+
+    timeoutFactor: float = 5.0
+    """Timeout as a multiple of the 95th percentile run time."""
+
+    minTimeout: float = 10.0
+    """Shortest timeout, in seconds, so that a busy machine
+    doesn't kill processes that are only a bit slow."""
+
+    initialTimeout: float = 300.0
+    """Timeout until enough run times are known."""
+
+    minSamples: int = 20
+    """How many run times are needed to adapt the timeout."""
+
+    numTimeouts: int = 0
+    """How many processes were killed for taking too long."""
+
+    def __init__(self, name:str, numWorkers:int, maxSamples:int=500):
+        """Instantiate Stage.
+
+        :param name: Name shown in messages.
+        :param numWorkers: How many processes may run at once.
+        :param maxSamples: How many of the latest run times to keep.
+        """
+        self.name  = name
+        self.slots = asyncio.Semaphore(numWorkers)
+        self._times = collections.deque(maxlen=maxSamples)
+        self._timeout = self.initialTimeout
+
+    def record(self, seconds:float, scale:int=1) -> None:
+        """Record how long a process took.
+
+        :param seconds: The run time.
+        :param scale: How many jobs the process did at once.
+        """
+        self._times.append(seconds / scale)
+        if len(self._times) >= self.minSamples:
+            times = sorted(self._times)
+            p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+            self._timeout = max(self.minTimeout, p95 * self.timeoutFactor)
+
+    def timeout(self, scale:int=1) -> float:
+        """Return how long to wait for a process.
+
+        :param scale: How many jobs the process does at once.
+        """
+        return self._timeout * scale
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import signal
+import time
+from .Stage import Stage, ProcessTimeout
+
+class Evaluator:
+    """Runs the fitness function for many candidates at once.
+
+    The real work (compiling and scoring) happens in subprocesses,
+    which are run from an asyncio event loop. Compiling and scoring
+    have their own limits on how many processes run at once, so
+    that one candidate can be scored while the next ones compile,
+    and their own timeouts.
+    """
+
+    numWorkers: int = None
+    """How many candidates to compile at the same time."""
+
+    numScoreWorkers: int = None
+    """How many candidates to score at the same time, or None
+    for the same as numWorkers."""
+
+    def __init__(self, numWorkers:int=None, numScoreWorkers:int=None):
+        self.numWorkers = numWorkers or os.cpu_count() or 1
+        self.numScoreWorkers = numScoreWorkers
+        self._loop = None
+        self._tasks = set() # unfinished tasks started by spawn()
+        self.compileStage: Stage = None
+        """Limits and times the compile processes."""
+        self.scoreStage: Stage = None
+        """Limits and times the score processes."""
+
+    def start(self) -> None:
+        """Start the event loop."""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self.compileStage = Stage("compile", self.numWorkers)
+            self.scoreStage = Stage("score",
+                self.numScoreWorkers or self.numWorkers)
+
+    def stop(self) -> None:
+        """Stop the event loop, cancelling any unfinished work."""
+        if self._loop is not None:
+            self._cancelAll()
+            self._loop.close()
+            self._loop = None
+
+    def numTimeouts(self) -> int:
+        """Return how many processes were killed for taking
+        too long."""
+        if self._loop is None: return 0
+        return self.compileStage.numTimeouts + self.scoreStage.numTimeouts
+
+    def run(self, coro):
+        """Run one coroutine to completion and return its result."""
+        self.start()
+        return self._loop.run_until_complete(coro)
+
+    def evaluate(self, fitness:callable, members:list):
+        """Run `fitness` on every member.
+
+        :param fitness: Coroutine function taking one member and
+            returning its score.
+        :param members: The members to evaluate.
+        :returns: A generator yielding `(member, score)` in the
+            order the evaluations finish.
+        """
+        self.start()
+        tasks = {self.spawn(fitness(m)): m for m in members}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = self._loop.run_until_complete(
+                    asyncio.wait(pending,
+                        return_when=asyncio.FIRST_COMPLETED))
+                for task in done: yield tasks[task], task.result()
+        finally:
+            # if something went wrong or the caller stopped early,
+            # don't leave the rest running. this includes work the
+            # tasks started, such as batches being compiled.
+            self._cancelAll()
+
+    def spawn(self, coro) -> asyncio.Task:
+        """Start a task, which is cancelled if the evaluation
+        stops early."""
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _cancelAll(self) -> None:
+        """Cancel every task started by spawn() and wait for them
+        to finish, which kills their processes.
+
+        This mustn't cancel asyncio's own tasks, such as the ones
+        that connect a new process's pipes."""
+        tasks = set(self._tasks)
+        for task in tasks: task.cancel()
+        if tasks:
+            self._loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True))
+
+    async def runProcess(self, cmd:list[str], stage:Stage,
+    scale:int=1) -> tuple[int, bytes, bytes, float]:
+        """Run a command once the stage has a free slot.
+
+        :param cmd: The command to run.
+        :param stage: compileStage or scoreStage.
+        :param scale: How many jobs the command does at once.
+        :returns: The return code, stdout, stderr, and how many
+            seconds the command ran.
+        :raises ProcessTimeout: If the command took too long.
+        """
+        async with stage.slots:
+            proc = await startProcess(cmd)
+            start = time.monotonic()
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(),
+                    stage.timeout(scale))
+            except asyncio.TimeoutError:
+                killProcess(proc)
+                await proc.wait()
+                stage.numTimeouts += 1
+                raise ProcessTimeout(f"{stage.name} timed out")
+            except asyncio.CancelledError:
+                killProcess(proc)
+                await proc.wait()
+                raise
+            seconds = time.monotonic() - start
+            stage.record(seconds, scale)
+        return proc.returncode, stdout, stderr, seconds
+
+async def startProcess(cmd:list[str]) -> asyncio.subprocess.Process:
+    """Start a command in its own process group, with its output
+    piped back."""
+    return await asyncio.create_subprocess_exec(*cmd,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        start_new_session=True)
+
+def killProcess(proc:asyncio.subprocess.Process) -> None:
+    """Kill a process and anything it started, if it hasn't
+    exited already."""
+    try: os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError: pass
@@ -9,10 +9,11 @@ class AddCast(Mutator):
     # are types and where to actually insert casts
 
     def mutate(self, code:list[Token]) -> list[Token]:
+        index = self.collection.index
         pos = random.randint(0, len(code)-1)
         # insert in reverse since we push the others up.
-        code.insert(pos, Token(')'))
-        code.insert(pos,
+        index.insert(pos, Token(')'))
+        index.insert(pos,
             Token(self.collection.getRandomIdentifier()))
-        code.insert(pos, Token('('))
+        index.insert(pos, Token('('))
         return code
@@ -7,6 +7,6 @@ class AddString(Mutator):
 
     def mutate(self, code:list[Token]) -> list[Token]:
         pos = random.randint(0, len(code)-1)
-        code.insert(pos,
+        self.collection.index.insert(pos,
             Token(f'\n"Dummy string {random.randint(0,999999999)}";'))
         return code
@@ -7,10 +7,9 @@ class ChangeIdentifier(Mutator):
     found in the same code."""
 
     def mutate(self, code:list[Token]) -> list[Token]:
-        token = self.collection.randomToken(code,
-            lambda tk: tk.type == TokenType.IDENTIFIER)
-        if token is None: return code
-        val = self.collection.getRandomIdentifier(token.value)
+        pos = self.collection.randomToken(TokenType.IDENTIFIER)
+        if pos is None: return code
+        val = self.collection.getRandomIdentifier(code[pos].value)
         if val is not None:
-            self.collection.cloneToken(code, token)._value = val
+            self.collection.cloneToken(pos)._value = val
         return code
@@ -6,9 +6,8 @@ class ChangeKeyword(Mutator):
     """Change a random keyword."""
 
     def mutate(self, code:list[Token]) -> list[Token]:
-        token = self.collection.randomToken(code,
-            lambda tk: tk.type == TokenType.KEYWORD)
-        if token is None: return code
-        self.collection.cloneToken(code, token)._value = \
+        pos = self.collection.randomToken(TokenType.KEYWORD)
+        if pos is None: return code
+        self.collection.cloneToken(pos)._value = \
             random.choice(self.collection._keywords)
         return code
@@ -15,17 +15,16 @@ class ChangeNumberFormat(Mutator):
         limit = 1000
         val   = None
         while limit > 0 and val is None:
-            token = self.collection.randomToken(code,
-                lambda tk: tk.type == TokenType.CONSTANT)
-            if token is None: return code
-            try: val = int(token.value, 0)
+            pos = self.collection.randomToken(TokenType.CONSTANT)
+            if pos is None: return code
+            try: val = int(code[pos].value, 0)
             except ValueError:
-                try: val = float(token.value)
+                try: val = float(code[pos].value)
                 except ValueError: val = None
             limit -= 1
         if not val: return code
 
-        token = self.collection.cloneToken(code, token)
+        token = self.collection.cloneToken(pos)
         formatters = intFormatters if type(val) is int else floatFormatters
         token._value = random.choice(formatters) % val
         return code
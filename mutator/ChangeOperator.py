@@ -10,9 +10,8 @@ class ChangeOperator(Mutator):
     """Change a random operator."""
 
     def mutate(self, code:list[Token]) -> list[Token]:
-        token = self.collection.randomToken(code,
-            lambda tk: tk.type == TokenType.OPERATOR)
-        if token is None: return code
-        self.collection.cloneToken(code, token)._value = \
+        pos = self.collection.randomToken(TokenType.OPERATOR)
+        if pos is None: return code
+        self.collection.cloneToken(pos)._value = \
             random.choice(operators)
         return code
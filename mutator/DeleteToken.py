@@ -7,5 +7,5 @@ class DeleteToken(Mutator):
 
     def mutate(self, code:list[Token]) -> list[Token]:
         pos = random.randint(0, len(code)-1)
-        code.pop(pos)
+        self.collection.index.pop(pos)
         return code
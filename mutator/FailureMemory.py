@@ -0,0 +1,81 @@
+from __future__ import annotations
+from array import array
+from parser import Token
+
+class FailureMemory:
+    """Remembers which edits made candidates fail to compile, so
+    that the mutators can avoid making them again.
+
+    An edit is identified by the mutator, the tokens it removed and
+    inserted, and the tokens on either side, not by its position,
+    since the same spot moves around between members. The counts
+    are kept in fixed-size tables indexed by a hash of that, so
+    unrelated edits can share a slot, but memory use never grows.
+    """
+
+    size: int = 1 << 18
+    """Number of slots in the count tables."""
+
+    minTries: int = 4
+    """How many times an edit must be tried before it's avoided."""
+
+    maxTries: int = 1000
+    """Counts are halved when a slot reaches this, so that old
+    results count less than new ones."""
+
+    def __init__(self):
+        self._tries = array('I', bytes(4 * self.size))
+        self._fails = array('I', bytes(4 * self.size))
+        self.numRecorded = 0
+        """Number of candidates recorded."""
+        self.numFailed = 0
+        """Number of recorded candidates that failed."""
+
+    def editKey(self, mutator:str, old:list[Token],
+    new:list[Token]) -> int:
+        """Return the slot for an edit that turned `old` into `new`.
+
+        :param mutator: Name of the mutator that made the edit.
+        """
+        n = min(len(old), len(new))
+        start = 0 # length of the unchanged start
+        while start < n and old[start].value == new[start].value:
+            start += 1
+        end = 0 # length of the unchanged end
+        while (end < n - start
+        and old[-1-end].value == new[-1-end].value):
+            end += 1
+        edit = (mutator,
+            old[start-1].value if start else None,
+            tuple(t.value for t in old[start:len(old)-end]),
+            tuple(t.value for t in new[start:len(new)-end]),
+            old[len(old)-end].value if end else None)
+        return hash(edit) % self.size
+
+    def record(self, keys:tuple[int], failed:bool) -> None:
+        """Record whether a candidate made with some edits compiled.
+
+        Which of its edits was at fault isn't known, so all of
+        them are counted.
+        """
+        self.numRecorded += 1
+        if failed: self.numFailed += 1
+        for key in keys:
+            if self._tries[key] >= self.maxTries:
+                self._tries[key] //= 2
+                self._fails[key] //= 2
+            self._tries[key] += 1
+            if failed: self._fails[key] += 1
+
+    def failRate(self, key:int) -> float:
+        """Return the share of candidates with this edit that
+        failed, or 0 if it hasn't been tried enough."""
+        tries = self._tries[key]
+        if tries < self.minTries: return 0
+        return self._fails[key] / tries
+
+    def validRate(self, recorded:int, failed:int) -> float:
+        """Return the share of candidates that compiled since the
+        given numbers had been recorded and had failed."""
+        return 1 - ((self.numFailed - failed)
+            / max(1, self.numRecorded - recorded))
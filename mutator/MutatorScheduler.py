@@ -0,0 +1,112 @@
+from __future__ import annotations
+from itertools import accumulate
+import random
+
+class MutatorScheduler:
+    """Decides how often to use each mutator, based on how well
+    the candidates it made have done.
+
+    A mutator's yield is the reward its candidates earned per
+    second spent compiling and scoring them. A candidate that beats
+    its parent earns 1, and one that only compiles earns
+    `compileReward`, so that there is something to go on before
+    anything improves. Mutators are picked in proportion to their
+    yield, except for the `explore` share of picks, which are
+    uniform so that no mutator is starved.
+
+    A candidate made by several mutators credits each of them
+    equally. Old results decay every generation, since what works
+    changes as the code does.
+    """
+
+    compileReward: float = 0.05
+    """Reward for a candidate that compiles but isn't better."""
+
+    explore: float = 0.2
+    """Share of picks that ignore the yields."""
+
+    priorTries: float = 20
+    """How many candidates' worth of the average yield each
+    mutator starts with, so a few lucky ones don't dominate."""
+
+    overhead: float = 0.1
+    """Cost of every candidate, even one that isn't compiled, as
+    a share of the average cost."""
+
+    decay: float = 0.95
+    """How much of the old results is kept each generation."""
+
+    def __init__(self, names:list[str]):
+        """Instantiate MutatorScheduler.
+
+        :param names: Names of the mutators, shown in summary().
+        """
+        n = len(names)
+        self.names = list(names)
+        self.weights = [1 / n] * n
+        """Chance of picking each mutator."""
+        self._cumWeights = list(accumulate(self.weights))
+        self._tries    = [0.0] * n
+        self._compiled = [0.0] * n
+        self._improved = [0.0] * n
+        self._seconds  = [0.0] * n
+
+    def pick(self) -> int:
+        """Return the index of a mutator to use."""
+        return random.choices(range(len(self.names)),
+            cum_weights=self._cumWeights)[0]
+
+    def record(self, mutators:tuple[int], compiled:bool,
+    improved:bool, seconds:float) -> None:
+        """Record how a candidate did.
+
+        :param mutators: Indices of the mutators that made it.
+        :param compiled: Whether it compiled.
+        :param improved: Whether it scored better than its parent.
+        :param seconds: How long compiling and scoring it took.
+        """
+        share = 1 / len(mutators)
+        for i in mutators:
+            self._tries[i] += share
+            if compiled: self._compiled[i] += share
+            if improved: self._improved[i] += share
+            self._seconds[i] += seconds * share
+
+    def update(self) -> None:
+        """Recompute the weights from the results so far, then
+        decay the results. Call once per generation."""
+        n = len(self.names)
+        total = sum(self._tries)
+        if total == 0: return
+        rewards = [improved + compiled * self.compileReward
+            for improved, compiled in zip(self._improved, self._compiled)]
+        meanReward = sum(rewards) / total
+        meanCost = sum(self._seconds) / total
+        # before anything is compiled, just compare rewards
+        minCost = self.overhead * meanCost if meanCost else 1
+        rates = [(reward + self.priorTries * meanReward)
+            / (seconds + tries * minCost
+                + self.priorTries * (meanCost + minCost))
+            for reward, seconds, tries in zip(rewards, self._seconds,
+                self._tries)]
+        totalRate = sum(rates)
+        if totalRate > 0:
+            self.weights = [(1 - self.explore) * rate / totalRate
+                + self.explore / n for rate in rates]
+            self._cumWeights = list(accumulate(self.weights))
+        for stat in (self._tries, self._compiled, self._improved,
+        self._seconds):
+            for i in range(n): stat[i] *= self.decay
+
+    def summary(self) -> str:
+        """Return each mutator's weight, compile rate, improvement
+        rate, and average cost, most used first."""
+        parts = []
+        for i in sorted(range(len(self.names)),
+        key=lambda i: -self.weights[i]):
+            tries = max(self._tries[i], 1e-9)
+            parts.append(f"{self.names[i]} {self.weights[i]:.0%}"
+                f" (ok {self._compiled[i]/tries:.0%}"
+                f" up {self._improved[i]/tries:.1%}"
+                f" {self._seconds[i]/tries:.2f}s)")
+        return ", ".join(parts)
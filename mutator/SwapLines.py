@@ -12,7 +12,7 @@ class SwapLines(Mutator):
 
             # find first and last tokens of this range
             tokens, iFirst, iLast = self.collection.getTokensForLineRange(
-                code, (line, line+1))
+                (line, line+1))
             if tokens:
                 # there's probably a better way to do this
                 line1, line2 = [], []
@@ -20,5 +20,5 @@ class SwapLines(Mutator):
                     if token.line == line: line1.append(token)
                     else: line2.append(token)
 
-                code = code[:iFirst] + line2 + line1 + code[iLast:]
+                self.collection.index.setRange(iFirst, line2 + line1)
         return code
@@ -8,5 +8,5 @@ class SwapTokens(Mutator):
     def mutate(self, code:list[Token]) -> list[Token]:
         if len(code) > 2:
             pos = random.randint(0, len(code)-2)
-            code[pos], code[pos+1] = code[pos+1], code[pos]
+            self.collection.index.swap(pos)
         return code
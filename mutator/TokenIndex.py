@@ -0,0 +1,164 @@
+from __future__ import annotations
+from bisect import bisect_left, bisect_right, insort
+import random
+from parser import Token, TokenType
+
+class TokenIndex:
+    """A token list, with the positions of its tokens by type and
+    by line, so that mutators don't need to search the whole list.
+
+    Changes must be made through the index, which keeps the type
+    positions up to date. The line table is only rebuilt when it's
+    needed after tokens were moved.
+    """
+    __slots__ = ('code', '_byType', '_lines', '_identifiers')
+
+    def __init__(self, code:list[Token]):
+        """Instantiate TokenIndex.
+
+        :param code: The tokens. Not copied; changed by the
+            index's methods.
+        """
+        self.code = code
+        # type's value => sorted positions. a list, because hashing
+        # an Enum is slow.
+        self._byType = [[] for _ in TokenType]
+        for i, token in enumerate(code):
+            self._byType[token.type.value].append(i)
+        self._lines = None # ([line], [position where it's first passed])
+        self._identifiers = None
+
+    def copy(self) -> TokenIndex:
+        """Return an index of a copy of the tokens."""
+        index = TokenIndex.__new__(TokenIndex)
+        index.code = self.code[:]
+        index._byType = [positions[:] for positions in self._byType]
+        # never changed in place, only replaced
+        index._lines = self._lines
+        index._identifiers = self._identifiers
+        return index
+
+    def identifiers(self) -> list[str]:
+        """Return the distinct identifier names, in order of their
+        first use. Only found once, so this doesn't follow later
+        changes."""
+        if self._identifiers is None:
+            code = self.code
+            self._identifiers = list(dict.fromkeys(code[i].value
+                for i in self._byType[TokenType.IDENTIFIER.value]))
+        return self._identifiers
+
+    def randomPosition(self, tokenType:TokenType) -> int | None:
+        """Return the position of a random token of the given type,
+        or None if there are none."""
+        positions = self._byType[tokenType.value]
+        if not positions: return None
+        return random.choice(positions)
+
+    def replace(self, pos:int, token:Token) -> None:
+        """Replace the token at a position."""
+        old = self.code[pos]
+        self.code[pos] = token
+        if token.type != old.type:
+            self._remove(old.type, pos)
+            self._add(token.type, pos)
+        if token.line != old.line: self._lines = None
+
+    def insert(self, pos:int, token:Token) -> None:
+        """Insert a token before a position."""
+        self.code.insert(pos, token)
+        self._shift(pos, 1)
+        self._add(token.type, pos)
+        self._lines = None
+
+    def pop(self, pos:int) -> Token:
+        """Remove and return the token at a position."""
+        token = self.code.pop(pos)
+        self._remove(token.type, pos)
+        self._shift(pos, -1)
+        self._lines = None
+        return token
+
+    def swap(self, pos:int) -> None:
+        """Swap the tokens at a position and the one after it."""
+        code = self.code
+        a, b = code[pos], code[pos+1]
+        code[pos], code[pos+1] = b, a
+        if a.type != b.type:
+            # neither list has the other position, so they
+            # stay sorted.
+            positions = self._byType[a.type.value]
+            positions[bisect_left(positions, pos)] = pos + 1
+            positions = self._byType[b.type.value]
+            positions[bisect_left(positions, pos + 1)] = pos
+        self._lines = None
+
+    def setRange(self, start:int, tokens:list[Token]) -> None:
+        """Replace as many tokens as given, from a position on."""
+        end = start + len(tokens)
+        for positions in self._byType:
+            del positions[bisect_left(positions, start):
+                bisect_left(positions, end)]
+        self.code[start:end] = tokens
+        for pos, token in enumerate(tokens, start):
+            self._add(token.type, pos)
+        self._lines = None
+
+    def lineRange(self, lStart:int, lEnd:int) -> tuple[int, int]:
+        """Find the tokens that occupy a line range.
+
+        Same as scanning from the start for the last token before
+        the range and the last token in it, until the first token
+        after the range, but only looks at the tokens near the end
+        of the range.
+
+        :returns: The index of the first token (which is the one
+            before the range) and the index after the last token,
+            or (0, 0) if there are none.
+        """
+        code = self.code
+        if self._lines is None: self._buildLines()
+        lines, starts = self._lines
+        # the first token after the range
+        j = bisect_right(lines, lEnd)
+        stop = starts[j] if j < len(starts) else len(code)
+        iFirst, iLast = None, None
+        i = stop - 1
+        while i >= 0 and iFirst is None:
+            line = code[i].line
+            if line < lStart: iFirst = i
+            elif iLast is None: iLast = i + 1 # range is exclusive
+            i -= 1
+        iFirst, iLast = iFirst or 0, iLast or 0
+        if iLast <= iFirst: return 0, 0
+        return iFirst, iLast
+
+    def _buildLines(self) -> None:
+        """Build the line table: each position where the highest
+        line so far goes up, and that line. The first token after
+        line N is where it first goes above N. Tokens aren't always
+        in line order once they've been moved around."""
+        lines, starts = [], []
+        highest = None
+        for i, token in enumerate(self.code):
+            if highest is None or token.line > highest:
+                highest = token.line
+                lines.append(highest)
+                starts.append(i)
+        self._lines = (lines, starts)
+
+    def _add(self, tokenType:TokenType, pos:int) -> None:
+        """Add a position to a type's list."""
+        insort(self._byType[tokenType.value], pos)
+
+    def _remove(self, tokenType:TokenType, pos:int) -> None:
+        """Remove a position from a type's list."""
+        positions = self._byType[tokenType.value]
+        del positions[bisect_left(positions, pos)]
+
+    def _shift(self, pos:int, delta:int) -> None:
+        """Move the positions from `pos` on by `delta`."""
+        for positions in self._byType:
+            i = bisect_left(positions, pos)
+            if i < len(positions):
+                positions[i:] = [p + delta for p in positions[i:]]
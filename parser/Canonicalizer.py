@@ -0,0 +1,120 @@
+from __future__ import annotations
+from sctokenizer.token import TokenType
+
+wordChars = frozenset(
+    'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+"""Characters that can appear in identifiers, keywords and numbers."""
+
+operatorChars = frozenset('+-*/%<>=!&|^.:#')
+"""Characters that can combine into a longer operator."""
+
+def _joins(left:str, right:str) -> bool:
+    """Check whether two characters written next to each other
+    would be read as part of one token."""
+    if left in wordChars:
+        return right in wordChars or right in '"\''
+    if left in operatorChars:
+        return right in operatorChars or (
+            left == '.' and right.isdigit())
+    return False
+
+class Canonicalizer:
+    """Builds the canonical form of some code a piece at a time:
+    the code without comments or the exact whitespace between
+    tokens.
+
+    Code with the same canonical form compiles the same way
+    (unless it depends on line numbers, such as `__LINE__`).
+    Whitespace is only kept where it's needed to separate two
+    tokens, inside strings, and in preprocessor directives
+    (where eg `#define A (x)` and `#define A(x)` differ).
+
+    The output for a piece of code only depends on that code and
+    the state left by the code before it, so the state can be
+    saved and used to continue from the same point later.
+    """
+
+    initialState = ('', False, False, False, False, None, False)
+    """The state before any code."""
+
+    def __init__(self, state:tuple=None):
+        """Instantiate Canonicalizer.
+
+        :param state: The state to continue from, from state().
+        """
+        self._result = []
+        self._state  = state or self.initialState
+
+    def state(self) -> tuple:
+        """Return the current state."""
+        return self._state
+
+    def text(self) -> str:
+        """Return the canonical form of the code fed so far."""
+        return ''.join(self._result)
+
+    def feed(self, tokens:list[Token]) -> None:
+        """Add more code."""
+        result = self._result
+        (last,      # last character written
+        gap,        # whitespace or comment since last token
+        newline,    # ...which includes a line break
+        directive,  # in a preprocessor directive
+        escaped,    # directive continues on the next line
+        quote,      # inside a string or character constant
+        started,    # anything was written
+        ) = self._state
+        for token in tokens:
+            if quote is not None:
+                # keep the contents verbatim
+                result.append(token.value)
+                if (token.type == TokenType.SPECIAL_SYMBOL
+                and token.value == quote):
+                    quote, last = None, token.value
+                    gap = token.trailingWhitespace != ''
+                    newline = '\n' in token.trailingWhitespace
+                else: result.append(token.trailingWhitespace)
+                continue
+
+            if token.isComment():
+                # a line comment ends the line; others act as a space
+                gap = True
+                newline = newline or token.isLineComment()
+                newline = newline or '\n' in token.trailingWhitespace
+                continue
+
+            value = token.value.strip()
+            if value != token.value: # eg from AddString
+                gap = True
+                newline = newline or '\n' in token.value[
+                    :len(token.value) - len(token.value.lstrip())]
+            if value != '':
+                lineStart = newline or not started
+                if escaped:
+                    result.append('\n')
+                    escaped = False
+                elif directive and newline:
+                    result.append('\n')
+                    directive = False
+                elif value.startswith('#') and lineStart:
+                    result.append('\n')
+                elif gap and (directive or _joins(last, value[0])):
+                    result.append(' ')
+                if value.startswith('#') and lineStart: directive = True
+                result.append(value)
+                started = True
+                last = value[-1]
+                if directive and value == '\\': escaped = True
+                if (token.type == TokenType.SPECIAL_SYMBOL
+                and value in ('"', "'")):
+                    quote = value
+                    result.append(token.trailingWhitespace)
+                    continue
+                gap = newline = False
+
+            space = token.value[len(token.value.rstrip()):] + \
+                token.trailingWhitespace
+            gap = gap or space != ''
+            newline = newline or '\n' in space
+        self._state = (last, gap, newline, directive, escaped,
+            quote, started)
@@ -0,0 +1,169 @@
+from __future__ import annotations
+from sctokenizer.assets.c_keywords import c_keyword_set
+from sctokenizer.assets.c_operators import c_operator_set
+from sctokenizer.token import TokenType
+import re
+import sys
+
+re_space = re.compile(r'\s*')
+
+# operators made of symbols, longest first so that eg `>>=`
+# isn't read as `>>` `=`. `?:` is left out since it's really
+# two tokens.
+_symbolOperators = sorted(
+    (op for op in c_operator_set if not op[0].isalpha() and op != '?:'),
+    key=len, reverse=True)
+
+re_token = re.compile(r'''
+      (?P<blockComment> /\*.*?(?:\*/|\Z) )
+    | (?P<lineComment>  //[^\n]*\n? )
+    | (?P<quote>        ["'] )
+    | (?P<number>       \.?[0-9](?:[eEpP][+-]|[0-9A-Za-z_.])* )
+    | (?P<word>         [A-Za-z_\x80-\U0010FFFF][0-9A-Za-z_\x80-\U0010FFFF]* )
+    | (?P<ellipsis>     \.\.\. )
+    | (?P<operator>     ''' + '|'.join(map(re.escape, _symbolOperators)) + r''' )
+    | (?P<symbol>       . )
+''', re.VERBOSE | re.DOTALL)
+
+# the contents of a string or character constant, which may
+# end early at a line break if the closing quote is missing.
+re_stringBody = {
+    '"': re.compile(r'(?:[^"\\\n]|\\.)*', re.DOTALL),
+    "'": re.compile(r"(?:[^'\\\n]|\\.)*", re.DOTALL),
+}
+re_includeHeader = re.compile(r'<([^>\n]*)(>?)')
+
+class Lexer:
+    """Splits C source into tokens in one pass, keeping the
+    whitespace and comments, so that joining the tokens'
+    values and trailing whitespace gives back the exact source.
+
+    Tokens are classified the same way sctokenizer does, except
+    that numbers include their suffix (`10u` is one constant),
+    `/` is an operator, and `"`/`<` include file names are strings.
+    """
+
+    def tokenize(self, code:str, tokenClass:type) -> list[Token]:
+        """Split the code into tokens.
+
+        :param code: The source code.
+        :param tokenClass: The Token class to create.
+        :returns: The tokens.
+        """
+        self._code   = code
+        self._result = []
+        self._Token  = tokenClass
+        self._line   = 1 # current line number (1-indexed)
+        self._lineStart = 0 # offset of the current line
+        match = re_space.match(code)
+        if match.end() > 0:
+            # keep leading whitespace in an empty token
+            self._emit(0, 0, TokenType.OTHER)
+            self._space(0)
+        pos = match.end()
+        lineStart = True # only whitespace before this on its line
+        directive = None # name of the current preprocessor directive
+        while pos < len(code):
+            match = re_token.match(code, pos)
+            kind  = match.lastgroup
+            end   = match.end()
+            if kind == 'blockComment' or kind == 'lineComment':
+                self._emit(pos, end, TokenType.COMMENT_SYMBOL)
+            elif kind == 'quote':
+                end = self._quoted(pos)
+            elif kind == 'number':
+                self._emit(pos, end, TokenType.CONSTANT)
+            elif kind == 'word':
+                word = match.group()
+                if word in c_operator_set: kind = TokenType.OPERATOR
+                elif word in c_keyword_set: kind = TokenType.KEYWORD
+                else: kind = TokenType.IDENTIFIER
+                self._emit(pos, end, kind)
+                if directive == '': directive = word
+            elif kind == 'operator':
+                if directive == 'include' and code[pos] == '<':
+                    end = self._header(pos)
+                else: self._emit(pos, end, TokenType.OPERATOR)
+            else:
+                self._emit(pos, end, TokenType.SPECIAL_SYMBOL)
+                if lineStart and match.group() == '#': directive = ''
+
+            pos  = self._space(end)
+            last = self._result[-1]
+            if '\n' in last.trailingWhitespace or last.isLineComment():
+                lineStart = True
+                # a backslash continues the directive on the next line
+                if last.value != '\\': directive = None
+            else: lineStart = False
+        return self._result
+
+    def _emit(self, start:int, end:int, type:TokenType) -> None:
+        """Add a token for code[start:end]."""
+        # most values and whitespace repeat many times, so keep
+        # only one copy of each.
+        value = sys.intern(self._code[start:end])
+        token = self._Token(value)
+        token._type   = type
+        token._line   = self._line
+        token._column = start - self._lineStart + 1
+        # a line comment's line break isn't really part of it.
+        nLines = value.count('\n', 0, len(value.rstrip('\n')))
+        if nLines:
+            lastBreak = self._code.rindex('\n', start, end)
+            token._endLine   = self._line + nLines
+            token._endColumn = end - lastBreak
+        else:
+            token._endLine   = self._line
+            token._endColumn = token._column + len(value)
+        self._newLines(start, end)
+        self._result.append(token)
+
+    def _space(self, pos:int) -> int:
+        """Attach the whitespace at pos to the last token.
+
+        :returns: The offset after the whitespace.
+        """
+        end = re_space.match(self._code, pos).end()
+        if end > pos:
+            self._result[-1]._trailingWhitespace = \
+                sys.intern(self._code[pos:end])
+            self._newLines(pos, end)
+        return end
+
+    def _newLines(self, start:int, end:int) -> None:
+        """Count the line breaks in code[start:end]."""
+        n = self._code.count('\n', start, end)
+        if n:
+            self._line += n
+            self._lineStart = self._code.rindex('\n', start, end) + 1
+
+    def _quoted(self, pos:int) -> int:
+        """Add the tokens of a string or character constant that
+        starts at pos: the quotes are special symbols, and the
+        contents are a string or constant.
+
+        :returns: The offset after the closing quote.
+        """
+        quote = self._code[pos]
+        self._emit(pos, pos+1, TokenType.SPECIAL_SYMBOL)
+        end = re_stringBody[quote].match(self._code, pos+1).end()
+        if end > pos+1:
+            self._emit(pos+1, end, TokenType.STRING if quote == '"'
+                else TokenType.CONSTANT)
+        if self._code.startswith(quote, end):
+            self._emit(end, end+1, TokenType.SPECIAL_SYMBOL)
+            end += 1
+        return end
+
+    def _header(self, pos:int) -> int:
+        """Add the tokens of an `#include <...>` file name.
+
+        :returns: The offset after the closing bracket.
+        """
+        match = re_includeHeader.match(self._code, pos)
+        self._emit(pos, pos+1, TokenType.SPECIAL_SYMBOL)
+        if match.end(1) > pos+1:
+            self._emit(pos+1, match.end(1), TokenType.STRING)
+        if match.group(2):
+            self._emit(match.end(1), match.end(), TokenType.SPECIAL_SYMBOL)
+        return match.end()
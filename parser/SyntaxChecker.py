@@ -0,0 +1,169 @@
+from __future__ import annotations
+from sctokenizer.token import TokenType
+from . import Token
+from .Lexer import Lexer
+
+openers = {'(': ')', '[': ']', '{': '}'}
+closers = {')': '(', ']': '[', '}': '{'}
+
+binaryOperators = frozenset(('=', '+=', '-=', '*=', '/=', '%=', '&=',
+    '|=', '^=', '<<=', '>>=', '==', '!=', '<', '>', '<=', '>=', '&&',
+    '||', '/', '%', '<<', '>>', '|', '^', '.', '->'))
+"""Operators that can't be unary, so they need an operand on both
+sides."""
+
+endTokens = frozenset((')', ']', '}', ';', ','))
+"""Tokens that can't directly follow a binary operator."""
+
+statementKeywords = frozenset(('if', 'else', 'while', 'for', 'do',
+    'switch', 'case', 'return', 'goto', 'break', 'continue'))
+"""Keywords that can't be followed by `)`."""
+
+conditionKeywords = frozenset(('if', 'while', 'for', 'switch'))
+"""Keywords that must be followed by `(`."""
+
+class _State:
+    """Where the checker is in the code."""
+    __slots__ = ('stack', 'prev', 'lineStart', 'directive')
+
+    def __init__(self):
+        self.stack = [] # [opener, is a for loop, semicolons seen]
+        self.prev = None # last token that isn't a comment
+        self.lineStart = True # only whitespace before this on its line
+        self.directive = False # in a preprocessor directive
+
+    def copy(self) -> _State:
+        state = _State()
+        state.stack = [list(entry) for entry in self.stack]
+        state.prev = self.prev
+        state.lineStart = self.lineStart
+        state.directive = self.directive
+        return state
+
+class SyntaxChecker:
+    """Cheaply finds changes to the permuted code that can't
+    compile, so they don't need to be compiled.
+
+    This isn't a C parser. Macros can make almost anything valid,
+    so it only looks for mistakes that a macro can't fix:
+    unbalanced brackets, `;` inside parentheses, and impossible
+    pairs of tokens such as two binary operators in a row.
+    Preprocessor lines aren't checked.
+
+    The code outside the window never changes, so the state
+    before it is only found once.
+    """
+
+    def __init__(self, before:list[Token], window:list[Token],
+    after:list[Token]):
+        """Instantiate SyntaxChecker for the original code.
+
+        :param before: The tokens before the window.
+        :param window: The original tokens in the window.
+        :param after: The tokens after the window.
+        """
+        state = _State()
+        problem = self._feed(state, before)
+        self._start = state.copy()
+        # the first token after the window, to check the pair
+        # it makes with the window's last token.
+        self._next = next((t for t in after if not t.isComment()), None)
+        problem = problem or self._feed(state, window)
+        end = state.copy()
+        if self._next is not None: problem = problem or self._feed(end,
+            [self._next])
+        self._end = [e[0] for e in end.stack]
+        self.problem = problem or self._feed(state, after)
+        """Why the original code doesn't pass the checks, if it
+        doesn't. The checker can't be used then."""
+
+    def check(self, code:str) -> str | None:
+        """Check a new version of the window.
+
+        :param code: The window's code.
+        :returns: Why it can't compile, or None if it might.
+        """
+        if self.problem: return None
+        return self._check(Lexer().tokenize(code, Token))
+
+    def _check(self, window:list[Token]) -> str | None:
+        """Check a new version of the window's tokens."""
+        state = self._start.copy()
+        problem = self._feed(state, window)
+        if problem: return problem
+        if self._next is not None:
+            problem = self._feed(state, [self._next])
+            if problem: return problem
+        if [e[0] for e in state.stack] != self._end:
+            return "unbalanced brackets"
+        return None
+
+    def _feed(self, state:_State, tokens:list[Token]) -> str | None:
+        """Check some tokens, updating the state.
+
+        :returns: The first problem found, or None.
+        """
+        for token in tokens:
+            value = token.value
+            first = state.lineStart
+            state.lineStart = ('\n' in token.trailingWhitespace
+                or token.isLineComment())
+            if token.isComment() or value == '': continue
+            if state.directive or (first and value == '#'):
+                # skip preprocessor lines, unless continued
+                state.directive = (not state.lineStart
+                    or value == '\\')
+                state.prev = None
+                continue
+
+            problem = self._pair(state.prev, token)
+            if problem: return problem
+            afterFor = state.prev is not None and state.prev.value == 'for'
+            state.prev = token
+            if token.type != TokenType.SPECIAL_SYMBOL: continue
+            stack = state.stack
+            if value in openers:
+                stack.append([value, value == '(' and afterFor, 0])
+            elif value in closers:
+                if not stack: return f"unmatched '{value}'"
+                if stack[-1][0] != closers[value]:
+                    return f"'{stack[-1][0]}' closed by '{value}'"
+                stack.pop()
+            elif value == ';' and stack and stack[-1][0] != '{':
+                entry = stack[-1]
+                entry[2] += 1
+                if not entry[1] or entry[2] > 2:
+                    return f"';' inside '{entry[0]}'"
+        return None
+
+    def _pair(self, prev:Token | None, token:Token) -> str | None:
+        """Check whether two tokens can be next to each other."""
+        if prev is None: return None
+        a, b = prev.value, token.value
+        if a in binaryOperators and prev.type == TokenType.OPERATOR:
+            if b in endTokens or (b in binaryOperators
+            and token.type == TokenType.OPERATOR):
+                return f"'{a}' followed by '{b}'"
+        elif a in ('(', '[') and prev.type == TokenType.SPECIAL_SYMBOL:
+            if b in binaryOperators and token.type == TokenType.OPERATOR:
+                return f"'{a}' followed by '{b}'"
+        elif a == 'sizeof':
+            # an operator, not a keyword, to the lexer
+            if b in endTokens: return f"'{a}' followed by '{b}'"
+        elif prev.type == TokenType.KEYWORD:
+            if a in statementKeywords and b == ')':
+                return f"'{a}' followed by '{b}'"
+            if (a in conditionKeywords and b != '('
+            and token.type != TokenType.IDENTIFIER):
+                return f"'{a}' without a condition"
+            if (a in ('break', 'continue') and b != ';'
+            and token.type != TokenType.IDENTIFIER):
+                return f"'{a}' followed by '{b}'"
+        elif prev.type == TokenType.CONSTANT == token.type:
+            return "two constants in a row"
+        # a macro or a macro call (`STUB`, `STUB()`) could end
+        # the statement before `else`.
+        if (b == 'else' and a not in (';', '}', ')')
+        and prev.type != TokenType.IDENTIFIER):
+            return f"'else' after '{a}'"
+        return None
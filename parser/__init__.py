@@ -1,19 +1,20 @@
 from __future__ import annotations
-from sctokenizer import Token as ScToken
-from sctokenizer import Source
 from sctokenizer.token import TokenType
-import re
-
-re_lineBreak = re.compile('\n')
-re_space = re.compile(r'(\s+)')
+from .Lexer import Lexer
 
 class Token:
     """One token in a source code.
 
     This is used as a replacement for sctokenizer.token
     in order to handle whitespace and comments.
+
+    A population holds many copies of the whole file's tokens,
+    so tokens use slots instead of a dict to save memory.
     """
-    def __init__(self, token:Token | ScToken | str):
+    __slots__ = ('_value', '_type', '_line', '_column',
+        '_endLine', '_endColumn', '_trailingWhitespace')
+
+    def __init__(self, token:Token | str):
         """Instantiate Token.
 
         :param token: A token to copy from, or a string to
@@ -25,11 +26,6 @@ class Token:
             self._type   = TokenType.OTHER
             self._line   = 0
             self._column = 0
-        elif type(token) is ScToken:
-            self._value  = token.token_value
-            self._type   = token.token_type
-            self._line   = token.line
-            self._column = token.column
         else:
             self._value = token.value
             self._type = token.type
@@ -87,13 +83,13 @@ class Token:
         return self.type == TokenType.COMMENT_SYMBOL
 
     def isLineComment(self) -> bool:
-        return self.isComment() and self.value == '//'
+        return self.isComment() and self.value.startswith('//')
 
     def isBlockCommentStart(self) -> bool:
-        return self.isComment() and self.value == '/*'
+        return self.isComment() and self.value.startswith('/*')
 
     def isBlockCommentEnd(self) -> bool:
-        return self.isComment() and self.value == '*/'
+        return self.isComment() and self.value.endswith('*/')
 
 class Parser:
     """Parses C source into a list of tokens."""
@@ -112,38 +108,67 @@ class Parser:
 
     def parse(self, code:str) -> list[Token]:
         """Parse the given code."""
-        self._findLineStarts(code)
-        src: str = Source.from_str(code, lang='c')
-        tokens: list[Token] = [Token(t) for t in src.tokenize()]
-        result: list[Token] = []
-        i: int = 0
+        return Lexer().tokenize(code, Token)
+
+    def findFunctions(self, tokens:list[Token]) -> \
+    list[tuple[str, int, int, int]]:
+        """Find the function definitions in the code.
+
+        This doesn't really parse C; it looks for top-level braces
+        that follow a parenthesis, outside of preprocessor lines.
+
+        :returns: For each function, its name, the index of the
+            first token of its header, the index of its `{`, and
+            the index after its `}`.
+        """
+        result = []
+        depth     = 0    # brace depth
+        start     = 0    # first token of the current declaration
+        lineStart = True # token is the first on its line
+        directive = False
+        last      = None # last token that isn't a comment
+        i = 0
         while i < len(tokens):
             token = tokens[i]
             i += 1
-            if token.isBlockCommentStart():
-                # The next token should be the end.
-                # Fill in the comment body.
-                tkEnd = tokens[i]
-                i += 1
-                startOffs = self._getTokenStartIdx(token)
-                endOffs   = self._getTokenStartIdx(tkEnd)+2 # +2 for the '*/'
-                token._value = code[startOffs:endOffs]
-                token._endLine = tkEnd.line
-                token._endColumn = tkEnd.column+2
-
-            elif token.isLineComment():
-                # Add the body (comment to end of line)
-                startOffs = self._getTokenStartIdx(token)
-                # line is 1-indexed so this gives the next line
-                endOffs   = self._lineStarts[token.line]
-                token._value = code[startOffs:endOffs]
-                token._endColumn = token.column + len(token.value)
-
-            # extract the whitespace following the token
-            offs = self._getTokenStartIdx(token)+len(token.value)
-            space = re_space.match(code[offs:])
-            token._trailingWhitespace = space.group(1) if space else ''
-            result.append(token)
+            first, lineStart = lineStart, ('\n' in token.trailingWhitespace
+                or token.isLineComment())
+            if directive or (token.value == '#' and first):
+                # skip preprocessor lines, unless continued
+                directive = not lineStart or last.value == '\\'
+                last = token
+                if depth == 0 and not directive: start = i
+                continue
+            if token.isComment(): continue
+            last = token
+            if token.type != TokenType.SPECIAL_SYMBOL: continue
+
+            if token.value == '{':
+                iOpen = i - 1
+                depth += 1
+                if depth > 1: continue
+                header = tokens[start:iOpen]
+                prev = [t for t in header if not t.isComment()]
+                if (not prev or prev[-1].value != ')'
+                or any(t.value == '=' for t in prev)):
+                    continue # struct, initializer, etc
+                while i < len(tokens) and depth > 0: # find the end
+                    if tokens[i].type == TokenType.SPECIAL_SYMBOL:
+                        if tokens[i].value == '{': depth += 1
+                        elif tokens[i].value == '}': depth -= 1
+                    i += 1
+                # the name is right before the parameter list
+                name = next((t.value for t, u in zip(prev, prev[1:])
+                    if t.type == TokenType.IDENTIFIER and u.value == '('),
+                    None)
+                result.append((name, start, iOpen, i))
+                start = i
+                last = tokens[i-1]
+                lineStart = '\n' in last.trailingWhitespace
+            elif token.value == '}':
+                depth = max(depth - 1, 0)
+            elif token.value == ';' and depth == 0:
+                start = i
         return result
 
     def toString(self, tokens:list[Token]) -> str:
@@ -177,19 +202,3 @@ class Parser:
         return (text.replace('\n', '↩\x1B[0m\n\x1B[48;5;8m')
             .replace('\t', '↦')
             .replace(' ', '·'))
-
-    def _findLineStarts(self, code:str) -> None:
-        """Find the index at which each line begins in the code.
-
-        Note the first line is numbered 0.
-        """
-        self._lineStarts = [0] + [m.start()+1 for m
-            in re_lineBreak.finditer(code)]
-        self._lineStarts.append(len(code))
-
-    def _getTokenStartIdx(self, token:Token) -> int:
-        """Convert the token's line number and column number
-        to an offset into the code."""
-        # line and column are 1-based so subtract 1
-        offs = self._lineStarts[token.line - 1]
-        return offs + token.column - 1
@@ -0,0 +1,52 @@
+import unittest
+from app import App
+
+code = """#define LOCAL static
+static int helper(int x);
+LOCAL int counter;
+static
+int other(void);
+
+static int helper(int x) {
+    return x + 1;
+}
+
+static
+int other(void) { return 2; }
+
+int target(int y) {
+    static int calls;
+    calls++;
+    return helper(y) + other();
+}
+"""
+
+class ReduceToFunctionTest(unittest.TestCase):
+    def setUp(self):
+        self.app = App()
+        tokens = self.app.parser.parse(code)
+        reduced, self.name = self.app.reduceToFunction(tokens, (15, 19))
+        self.result = self.app.parser.toString(reduced)
+
+    def tearDown(self):
+        self.app.evaluator.stop()
+
+    def test_finds_function(self):
+        self.assertEqual(self.name, "target")
+
+    def test_static_forward_declarations(self):
+        lines = self.result.splitlines()
+        self.assertEqual(lines[1], "int helper(int x);")
+        self.assertEqual(lines[4], "int other(void);")
+        self.assertNotIn("static int helper", self.result)
+
+    def test_keeps_other_statics(self):
+        self.assertIn("#define LOCAL static\n", self.result)
+        self.assertIn("    static int calls;", self.result)
+
+    def test_keeps_line_numbers(self):
+        self.assertEqual(self.result.count("\n"), code.count("\n"))
+        self.assertEqual(self.result.splitlines()[13], "int target(int y) {")
+
+if __name__ == "__main__":
+    unittest.main()